@@ -0,0 +1,181 @@
+"""Compare sprite output formats: encode time, file size and decode time.
+
+    python bench_formats.py -i ..\\..\\Assets\\Character\\Kevin\\Idle
+    python bench_formats.py -i ..\\..\\Assets\\Character\\Kevin\\Idle --browser-page bench.html
+
+The PNG, lossless WebP and .sprb bundle encodings of the same frames are timed in Python.
+`--browser-page` also writes a self-contained HTML page that times the browser-side decode
+of each format (createImageBitmap for PNG/WebP, the bundle loader's decode for .sprb); open
+it in the browser the game targets.
+"""
+import argparse
+import base64
+import io
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Callable, List
+
+from PIL import Image
+
+from sprite_formats import decode_bundle, encode_bundle
+
+HERE = Path(__file__).resolve().parent
+DEFAULT_INPUT = HERE.parent.parent / "Assets" / "Character" / "Kevin" / "Idle"
+
+
+def encode_png(frames: List[Image.Image]) -> List[bytes]:
+    out = []
+    for img in frames:
+        buf = io.BytesIO()
+        img.save(buf, format="PNG")
+        out.append(buf.getvalue())
+    return out
+
+
+def encode_webp(frames: List[Image.Image]) -> List[bytes]:
+    out = []
+    for img in frames:
+        buf = io.BytesIO()
+        img.save(buf, format="WEBP", lossless=True, quality=100, method=4)
+        out.append(buf.getvalue())
+    return out
+
+
+def decode_files(files: List[bytes]) -> List[Image.Image]:
+    frames = []
+    for data in files:
+        img = Image.open(io.BytesIO(data))
+        img.load()
+        frames.append(img)
+    return frames
+
+
+def best_time(fn: Callable, runs: int):
+    times = []
+    result = None
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times), result
+
+
+BROWSER_PAGE = """<!doctype html>
+<meta charset="utf-8">
+<title>Sprite format decode benchmark</title>
+<pre id="out">Running...</pre>
+<script>
+const DATA = __DATA__;
+const RUNS = __RUNS__;
+const b64 = (s) => Uint8Array.from(atob(s), (c) => c.charCodeAt(0));
+
+// Same decode as src/utils/SpriteBundleLoader.ts
+async function decodeBundle(bytes) {
+    const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+    const headerLength = view.getUint32(8, true);
+    const header = JSON.parse(new TextDecoder().decode(bytes.subarray(12, 12 + headerLength)));
+    const stream = new Blob([bytes.subarray(12 + headerLength)]).stream().pipeThrough(new DecompressionStream('deflate'));
+    const payload = new Uint8Array(await new Response(stream).arrayBuffer());
+    const width = header.frameWidth, height = header.frameHeight;
+    return header.frames.map((f) => {
+        const image = new ImageData(width, height);
+        const out = image.data;
+        if (f.w === 0 || f.h === 0) return image;
+        const rowBytes = f.w * 3;
+        const pixels = Uint8Array.from(payload.subarray(f.rgb[0], f.rgb[0] + f.rgb[1]));
+        for (let i = rowBytes; i < pixels.length; i++) pixels[i] = (pixels[i] + pixels[i - rowBytes]) & 0xff;
+        for (let row = 0; row < f.h; row++) {
+            let src = row * rowBytes, dst = ((f.y + row) * width + f.x) * 4;
+            for (let col = 0; col < f.w; col++, src += 3, dst += 4) {
+                out[dst] = pixels[src]; out[dst + 1] = pixels[src + 1]; out[dst + 2] = pixels[src + 2];
+            }
+        }
+        const alpha = payload.subarray(f.alpha[0], f.alpha[0] + f.alpha[1]);
+        let p = 0;
+        for (let i = 0; i < alpha.length; i += 2) {
+            for (let k = 0; k < alpha[i]; k++, p++) {
+                const row = Math.floor(p / f.w);
+                out[((f.y + row) * width + f.x + p - row * f.w) * 4 + 3] = alpha[i + 1];
+            }
+        }
+        return image;
+    });
+}
+
+async function timeIt(fn) {
+    const times = [];
+    for (let r = 0; r < RUNS; r++) {
+        const t0 = performance.now();
+        await fn();
+        times.push(performance.now() - t0);
+    }
+    times.sort((a, b) => a - b);
+    return times[Math.floor(times.length / 2)];
+}
+
+(async () => {
+    const lines = ['format      decode ms (median of ' + RUNS + ')'];
+    for (const [name, mime] of [['png', 'image/png'], ['webp', 'image/webp']]) {
+        const blobs = DATA[name].map((s) => new Blob([b64(s)], { type: mime }));
+        const ms = await timeIt(async () => {
+            const bitmaps = await Promise.all(blobs.map((b) => createImageBitmap(b)));
+            bitmaps.forEach((bm) => bm.close());
+        });
+        lines.push(name.padEnd(12) + ms.toFixed(1));
+    }
+    const bundle = b64(DATA.bundle);
+    lines.push('bundle'.padEnd(12) + (await timeIt(() => decodeBundle(bundle))).toFixed(1));
+    document.getElementById('out').textContent = lines.join('\\n');
+})();
+</script>
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PNG vs lossless WebP vs .sprb bundle for a sprite folder.")
+    parser.add_argument("--input", "-i", default=str(DEFAULT_INPUT), help="Folder of RGBA PNG frames")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per measurement (default 3)")
+    parser.add_argument("--browser-page", help="Also write an HTML page that times decoding in the browser")
+    args = parser.parse_args()
+
+    paths = sorted(Path(args.input).glob("*.png"))
+    if not paths:
+        print(f"No PNGs found in {args.input}")
+        return
+    frames = []
+    for p in paths:
+        with Image.open(p) as img:
+            frames.append(img.convert("RGBA"))
+    on_disk = sum(p.stat().st_size for p in paths)
+    print(f"{len(frames)} frames of {frames[0].size[0]}x{frames[0].size[1]}, {on_disk / 1024:.0f} KiB of PNG on disk")
+
+    png_t, png = best_time(lambda: encode_png(frames), args.runs)
+    webp_t, webp = best_time(lambda: encode_webp(frames), args.runs)
+    bundle_t, bundle = best_time(lambda: encode_bundle(frames), args.runs)
+    png_d, _ = best_time(lambda: decode_files(png), args.runs)
+    webp_d, _ = best_time(lambda: decode_files(webp), args.runs)
+    bundle_d, _ = best_time(lambda: decode_bundle(bundle), args.runs)
+
+    print(f"{'format':8} {'files':>6} {'KiB':>9} {'encode s':>9} {'decode s':>9}")
+    for name, files, size, enc, dec in [
+        ("png", len(png), sum(map(len, png)), png_t, png_d),
+        ("webp", len(webp), sum(map(len, webp)), webp_t, webp_d),
+        ("bundle", 1, len(bundle), bundle_t, bundle_d),
+    ]:
+        print(f"{name:8} {files:6d} {size / 1024:9.0f} {enc:9.3f} {dec:9.3f}")
+
+    if args.browser_page:
+        data = {
+            "png": [base64.b64encode(b).decode("ascii") for b in png],
+            "webp": [base64.b64encode(b).decode("ascii") for b in webp],
+            "bundle": base64.b64encode(bundle).decode("ascii"),
+        }
+        page = BROWSER_PAGE.replace("__DATA__", json.dumps(data)).replace("__RUNS__", str(args.runs))
+        Path(args.browser_page).write_text(page, encoding="utf-8")
+        print(f"Wrote browser benchmark: {args.browser_page}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Cold-start benchmark for the animation-helper modules and CLIs.
+
+Each case runs in a fresh interpreter so nothing is cached between runs:
+
+    python bench_imports.py --runs 5
+"""
+import argparse
+import ast
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+
+
+def app_imports(path: Path = HERE / "streamlit_app.py") -> str:
+    """The module-level imports of the app as a script, so the case follows the app's own list.
+
+    Imports guarded by try/except in the app (optional components) may fail here too.
+    """
+    lines = []
+    for node in ast.parse(path.read_text(encoding="utf-8")).body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            lines.append(ast.unparse(node))
+        elif isinstance(node, ast.Try):
+            for inner in node.body:
+                if isinstance(inner, (ast.Import, ast.ImportFrom)):
+                    lines.append(f"try:\n    {ast.unparse(inner)}\nexcept Exception:\n    pass")
+    return "\n".join(lines)
+
+
+CASES = [
+    ("import sprite_utils", [sys.executable, "-c", "import sprite_utils"]),
+    ("import chroma_key", [sys.executable, "-c", "import chroma_key"]),
+    ("import video_to_sprites", [sys.executable, "-c", "import video_to_sprites"]),
+    ("import sprite_pipeline", [sys.executable, "-c", "import sprite_pipeline"]),
+    ("import upload_cache", [sys.executable, "-c", "import upload_cache"]),
+    ("chroma_key.py --help", [sys.executable, "chroma_key.py", "--help"]),
+    ("video_to_sprites.py --help", [sys.executable, "video_to_sprites.py", "--help"]),
+    # the app's own imports, without starting a Streamlit server
+    ("app imports", [sys.executable, "-c", app_imports()]),
+]
+
+
+def time_command(cmd, runs):
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        subprocess.run(cmd, cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import / CLI startup times.")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per case (default 5)")
+    parser.add_argument(
+        "--importtime",
+        metavar="MODULE",
+        help="Print the slowest imports of MODULE using `python -X importtime` instead",
+    )
+    args = parser.parse_args()
+
+    if args.importtime:
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {args.importtime}"],
+            cwd=HERE,
+            capture_output=True,
+            text=True,
+        )
+        rows = []
+        for line in proc.stderr.splitlines():
+            parts = line.split("|")
+            if len(parts) == 3 and parts[1].strip().isdigit():
+                rows.append((int(parts[1]), parts[2].rstrip()))
+        for cumulative, name in sorted(rows, reverse=True)[:25]:
+            print(f"{cumulative / 1e6:8.3f}s {name}")
+        return
+
+    print(f"{'case':32} {'median':>8} {'min':>8}")
+    for name, cmd in CASES:
+        times = time_command(cmd, args.runs)
+        print(f"{name:32} {statistics.median(times):8.3f} {min(times):8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Check and benchmark the tiled keying, halo removal and bbox against whole-frame versions.
+
+    python bench_tiles.py                    # 4K frame
+    python bench_tiles.py --size 7680x4320   # 8K frame
+
+Every tiled result is compared bit for bit with the original whole-frame implementation
+(kept below as reference), for several tile sizes including ones that do not divide the
+frame. Peak memory of each operation is measured in a fresh process (Linux only).
+"""
+import argparse
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+from chroma_key import make_alpha_by_chroma
+from sprite_pipeline import bbox_from_alpha, halo_remove
+
+KEY = (0, 255, 0)
+
+
+def reference_alpha_by_chroma(img, bg_color, threshold):
+    rgba = img.convert("RGBA")
+    arr = np.array(rgba)
+    rgb = arr[..., :3].astype(np.int16)
+    bg = np.array(bg_color, dtype=np.int16)
+    dist = np.linalg.norm(rgb - bg, axis=-1)
+    alpha = arr[..., 3].astype(np.float32)
+    alpha[dist <= threshold] = 0
+    arr[..., 3] = alpha.astype(np.uint8)
+    return Image.fromarray(arr)
+
+
+def reference_halo_remove(img, erode_px):
+    if erode_px <= 0:
+        return img
+    arr = np.array(img.convert("RGBA"))
+    pil_alpha = Image.fromarray(arr[..., 3]).filter(ImageFilter.MinFilter(size=1 + 2 * erode_px))
+    arr[..., 3] = np.array(pil_alpha)
+    return Image.fromarray(arr)
+
+
+def reference_bbox_from_alpha(img):
+    alpha = np.array(img.convert("RGBA"))[..., 3]
+    ys, xs = np.where(alpha > 8)
+    if len(xs) == 0:
+        return None
+    return int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1
+
+
+def synthetic_frame(width: int, height: int, seed: int = 0) -> Image.Image:
+    """Noisy green screen around a random-colored ellipse, so pixels fall on both sides of any threshold."""
+    rng = np.random.default_rng(seed)
+    arr = np.empty((height, width, 3), dtype=np.uint8)
+    arr[:] = KEY
+    arr = np.clip(arr.astype(np.int16) + rng.integers(-40, 41, arr.shape), 0, 255).astype(np.uint8)
+    yy, xx = np.ogrid[:height, :width]
+    subject = ((xx - width * 0.45) / (width * 0.2)) ** 2 + ((yy - height * 0.55) / (height * 0.35)) ** 2 < 1
+    arr[subject] = rng.integers(0, 256, (int(subject.sum()), 3), dtype=np.uint8)
+    return Image.fromarray(arr)
+
+
+OPS = {
+    "key": (
+        lambda img: reference_alpha_by_chroma(img, KEY, 40.0),
+        lambda img: make_alpha_by_chroma(img, KEY, 40.0),
+    ),
+    "halo": (
+        lambda img: reference_halo_remove(img, 3),
+        lambda img: halo_remove(img, 3),
+    ),
+    "bbox": (reference_bbox_from_alpha, bbox_from_alpha),
+}
+
+
+def check_identical(img: Image.Image) -> bool:
+    ok = True
+    for threshold in (0, 17.5, 40, 40.0000001, 69.99, 441.7):
+        ref = np.asarray(reference_alpha_by_chroma(img, KEY, threshold))
+        for tile in (64, 100, 512):
+            if not np.array_equal(ref, np.asarray(make_alpha_by_chroma(img, KEY, threshold, tile=tile))):
+                print(f"MISMATCH key threshold={threshold} tile={tile}")
+                ok = False
+    keyed = reference_alpha_by_chroma(img, KEY, 40)
+    for erode in (1, 2, 5):
+        ref = np.asarray(reference_halo_remove(keyed, erode))
+        for tile in (64, 100, 512):
+            if not np.array_equal(ref, np.asarray(halo_remove(keyed, erode, tile=tile))):
+                print(f"MISMATCH halo erode={erode} tile={tile}")
+                ok = False
+    for frame in (keyed, Image.new("RGBA", img.size, (0, 0, 0, 0)), img):
+        for tile in (64, 100, 512):
+            if reference_bbox_from_alpha(frame) != bbox_from_alpha(frame, tile=tile):
+                print(f"MISMATCH bbox tile={tile}")
+                ok = False
+    return ok
+
+
+def _proc_status_kib(field: str) -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    raise KeyError(field)
+
+
+def child(op: str, impl: int, width: int, height: int):
+    img = synthetic_frame(width, height)
+    if op != "key":
+        img = reference_alpha_by_chroma(img, KEY, 40.0)
+    # reset the peak RSS so building the test frame does not count
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    before = _proc_status_kib("VmRSS")
+    OPS[op][impl](img)
+    print((_proc_status_kib("VmHWM") - before) * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify and benchmark the tiled frame operations.")
+    parser.add_argument("--size", default="3840x2160", help="Frame size WxH (default 3840x2160)")
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    if args.child:
+        child(args.child[0], int(args.child[1]), width, height)
+        return
+
+    print("Checking tiled results against whole-frame versions (small frame)...")
+    if not check_identical(synthetic_frame(333, 257, seed=1)):
+        sys.exit(1)
+    print("All identical.")
+
+    img = synthetic_frame(width, height)
+    keyed = reference_alpha_by_chroma(img, KEY, 40.0)
+    print(f"\n{width}x{height} frame")
+    print(f"{'op':6} {'whole s':>8} {'tiled s':>8} {'whole MiB':>10} {'tiled MiB':>10}")
+    for op, fns in OPS.items():
+        src = img if op == "key" else keyed
+        times = []
+        for fn in fns:
+            t0 = time.perf_counter()
+            fn(src)
+            times.append(time.perf_counter() - t0)
+        mem = []
+        for impl in (0, 1):
+            if not sys.platform.startswith("linux"):
+                mem.append(float("nan"))
+                continue
+            out = subprocess.run(
+                [sys.executable, str(Path(__file__).resolve()), "--size", args.size, "--child", op, str(impl)],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            mem.append(int(out.stdout.strip()) / 1024 ** 2)
+        print(f"{op:6} {times[0]:8.3f} {times[1]:8.3f} {mem[0]:10.1f} {mem[1]:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
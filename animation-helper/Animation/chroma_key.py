@@ -1,11 +1,21 @@
 import argparse
+import math
 import os
 from pathlib import Path
-from typing import Tuple
+from typing import Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
 
 import numpy as np
 from PIL import Image
 
+from sprite_formats import FRAME_FORMATS, save_frame, write_bundle
+
+# Frames are keyed in TILE_SIZE x TILE_SIZE blocks so temporaries do not grow with the frame
+TILE_SIZE = 512
+# Largest squared distance between two RGB colors
+_MAX_DIST2 = 3 * 255 * 255
+# One histogram bin per unit of RGB distance, 0 .. sqrt(_MAX_DIST2)
+HIST_BINS = math.isqrt(_MAX_DIST2) + 2
+
 
 def parse_color(s: str) -> Tuple[int, int, int]:
     parts = [p.strip() for p in s.split(",")]
@@ -21,52 +31,253 @@ def parse_color(s: str) -> Tuple[int, int, int]:
     return r, g, b
 
 
-def sample_background_from_corners(img: Image.Image, patch: int = 10) -> Tuple[int, int, int]:
-    w, h = img.size
-    # sample small patches from the four corners and average
-    coords = [
-        (0, 0, patch, patch),
-        (w - patch, 0, w, patch),
-        (0, h - patch, patch, h),
-        (w - patch, h - patch, w, h),
+class BackgroundModel(NamedTuple):
+    color: Tuple[int, int, int]
+    spread: float
+    frames_sampled: int
+
+
+def _corner_boxes(w: int, h: int, patch: int) -> List[Tuple[int, int, int, int]]:
+    p = max(1, min(patch, w, h))
+    return [
+        (0, 0, p, p),
+        (w - p, 0, w, p),
+        (0, h - p, p, h),
+        (w - p, h - p, w, h),
     ]
-    arr = np.array(img.convert("RGB"), dtype=np.float32)
+
+
+def sample_corner_patches(img: Image.Image, patch: int = 10) -> np.ndarray:
+    """Return the RGB pixels of the four corner patches as an (N, 3) float32 array.
+
+    Only the patches are cropped and converted, so the cost is O(patch) rather than O(frame).
+    """
+    w, h = img.size
     samples = []
-    for (x1, y1, x2, y2) in coords:
-        x1 = max(0, x1)
-        y1 = max(0, y1)
-        x2 = min(w, x2)
-        y2 = min(h, y2)
-        patch_arr = arr[y1:y2, x1:x2]
-        if patch_arr.size == 0:
-            continue
+    for box in _corner_boxes(w, h, patch):
+        patch_arr = np.asarray(img.crop(box).convert("RGB"), dtype=np.float32)
         samples.append(patch_arr.reshape(-1, 3))
-    if not samples:
-        return 0, 0, 0
-    all_samples = np.concatenate(samples, axis=0)
-    mean = all_samples.mean(axis=0)
+    return np.concatenate(samples, axis=0)
+
+
+def sample_background_from_corners(img: Image.Image, patch: int = 10) -> Tuple[int, int, int]:
+    # sample small patches from the four corners and average
+    mean = sample_corner_patches(img, patch).mean(axis=0)
     return int(mean[0]), int(mean[1]), int(mean[2])
 
 
-def make_alpha_by_chroma(img: Image.Image, bg_color: Tuple[int, int, int], threshold: float) -> Image.Image:
-    rgba = img.convert("RGBA")
-    arr = np.array(rgba)
-    rgb = arr[..., :3].astype(np.int16)
-    bg = np.array(bg_color, dtype=np.int16)
-    # Euclidean distance in RGB space
-    dist = np.linalg.norm(rgb - bg, axis=-1)
-    mask_transparent = dist <= threshold
-    # Optionally, you can soften edges by applying a distance-based alpha ramp
-    alpha = arr[..., 3].astype(np.float32)
+def build_background_model(
+    frames: Sequence[Union[Path, Image.Image]], patch: int = 10, max_frames: int = 16
+) -> BackgroundModel:
+    """Build one key color for a whole sequence from corner patches of a subset of frames.
 
-    # New alpha: where close to bg -> 0, else keep existing 255
-    alpha[mask_transparent] = 0
-    arr[..., 3] = alpha.astype(np.uint8)
+    The key color is the per-channel median of all sampled pixels, so a subject touching a
+    corner in a few frames does not pull it off. `spread` is three times the median distance
+    of the samples from the key color, a noise estimate that outlier frames cannot inflate.
+    """
+    if not frames:
+        return BackgroundModel((0, 0, 0), 0.0, 0)
+    samples = []
+    for i in _spread_indices(len(frames), max_frames):
+        f = frames[i]
+        if isinstance(f, Image.Image):
+            samples.append(sample_corner_patches(f, patch))
+        else:
+            with Image.open(f) as img:
+                samples.append(sample_corner_patches(img, patch))
+    all_samples = np.concatenate(samples, axis=0)
+    key = np.median(all_samples, axis=0)
+    dist = np.linalg.norm(all_samples - key, axis=-1)
+    spread = 3.0 * float(np.median(dist))
+    color = (int(round(key[0])), int(round(key[1])), int(round(key[2])))
+    return BackgroundModel(color, spread, len(samples))
+
+
+def background_drift(img: Image.Image, model: BackgroundModel, patch: int = 10) -> float:
+    """Distance between this frame's corner background and the model key color."""
+    local = np.median(sample_corner_patches(img, patch), axis=0)
+    return float(np.linalg.norm(local - np.array(model.color, dtype=np.float32)))
+
+
+class ThresholdEstimate(NamedTuple):
+    threshold: float
+    # 0..1: how cleanly the distance histogram splits into background and subject
+    confidence: float
+    # fraction of the sampled pixels that the threshold removes
+    background: float
+    color: Tuple[int, int, int]
+
+
+def _spread_indices(count: int, max_frames: int) -> List[int]:
+    picks = np.linspace(0, count - 1, min(count, max(1, max_frames))).round().astype(int)
+    return sorted(set(picks.tolist()))
+
+
+def _subsample(img: Image.Image, max_pixels: int) -> Image.Image:
+    w, h = img.size
+    step = max(1, math.ceil(math.sqrt(w * h / max_pixels)))
+    return img.resize((max(1, w // step), max(1, h // step)), Image.NEAREST).convert("RGBA")
+
+
+def distance_histogram(
+    frames: Sequence[Union[Path, Image.Image]],
+    color: Tuple[int, int, int],
+    max_frames: int = 16,
+    max_pixels: int = 65536,
+) -> np.ndarray:
+    """Histogram (1-unit bins) of the RGB distance of pixels to `color` across a sequence.
+
+    Up to `max_frames` frames spread over the sequence are nearest-neighbour subsampled to
+    about `max_pixels` pixels each, so the cost does not depend on the frame size. Pixels
+    that are already transparent are left out.
+    """
+    counts = np.zeros(HIST_BINS, dtype=np.int64)
+    key = np.array(color, dtype=np.int32)
+    for i in _spread_indices(len(frames), max_frames):
+        f = frames[i]
+        if isinstance(f, Image.Image):
+            small = _subsample(f, max_pixels)
+        else:
+            with Image.open(f) as img:
+                small = _subsample(img, max_pixels)
+        arr = np.asarray(small).reshape(-1, 4)
+        arr = arr[arr[:, 3] > 0, :3].astype(np.int32) - key
+        dist = np.sqrt((arr * arr).sum(axis=1))
+        counts += np.bincount(dist.astype(np.int64), minlength=HIST_BINS)
+    return counts
 
-    return Image.fromarray(arr)
 
+def threshold_from_histogram(hist: np.ndarray, smooth: int = 5) -> Tuple[float, float]:
+    """Pick the background/subject split of a distance histogram; returns (threshold, confidence).
 
-def process_folder(input_dir: Path, output_dir: Path, bgcolor, threshold: float, in_place: bool, sample_corners: bool):
+    Otsu's method splits the histogram into a background class (near the key color) and a
+    subject class. The threshold is then moved to the valley between the two modes: the
+    middle of the lowest stretch of the smoothed histogram, which keeps the widest margin to
+    both. Confidence is Otsu's separability (between-class / total variance) scaled by how
+    empty that valley is compared with the smaller of the two peaks.
+    """
+    total = float(hist.sum())
+    if total == 0:
+        return 0.0, 0.0
+    p = hist / total
+    bins = np.arange(len(hist), dtype=np.float64)
+    omega = np.cumsum(p)
+    mu = np.cumsum(p * bins)
+    mu_t = mu[-1]
+    var_t = float((p * (bins - mu_t) ** 2).sum())
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigma_b = np.nan_to_num((mu_t * omega - mu) ** 2 / (omega * (1.0 - omega)))
+    split = int(np.argmax(sigma_b))
+    if var_t == 0 or split + 1 >= len(hist):
+        # a single color: nothing to separate
+        return float(split), 0.0
+    separability = float(sigma_b[split]) / var_t
+
+    smoothed = np.convolve(hist.astype(np.float64), np.ones(smooth) / smooth, mode="same")
+    lo = int(np.argmax(smoothed[: split + 1]))
+    hi = split + 1 + int(np.argmax(smoothed[split + 1 :]))
+    valley = smoothed[lo : hi + 1]
+    lowest = np.flatnonzero(valley <= valley.min() + 1e-9) + lo
+    threshold = float(lowest[len(lowest) // 2])
+    peak = min(smoothed[lo], smoothed[hi])
+    depth = 1.0 - float(valley.min()) / peak if peak > 0 else 0.0
+    return threshold, float(max(0.0, min(1.0, separability * depth)))
+
+
+def estimate_threshold(
+    frames: Sequence[Union[Path, Image.Image]],
+    color: Optional[Tuple[int, int, int]] = None,
+    max_frames: int = 16,
+) -> ThresholdEstimate:
+    """Estimate the chroma-key threshold (and, if not given, the key color) for a sequence.
+
+    One pass over a subsample of the frames replaces tuning the threshold by eye. Without
+    `color` the key color comes from the sequence's corner background model.
+    """
+    if not frames:
+        return ThresholdEstimate(0.0, 0.0, 0.0, color or (0, 0, 0))
+    if color is None:
+        color = build_background_model(frames, max_frames=max_frames).color
+    hist = distance_histogram(frames, color, max_frames=max_frames)
+    threshold, confidence = threshold_from_histogram(hist)
+    background = float(hist[: int(threshold) + 1].sum()) / max(1, int(hist.sum()))
+    return ThresholdEstimate(threshold, confidence, background, tuple(int(c) for c in color))
+
+
+def parse_threshold(s: str) -> Union[float, str]:
+    """argparse type for `--threshold`: a distance, or 'auto'."""
+    if s.strip().lower() == "auto":
+        return "auto"
+    try:
+        return float(s)
+    except ValueError:
+        raise argparse.ArgumentTypeError("Threshold must be a number or 'auto'")
+
+
+def tile_boxes(width: int, height: int, tile: int = TILE_SIZE) -> Iterator[Tuple[int, int, int, int]]:
+    """(x1, y1, x2, y2) boxes covering a width x height frame in row-major tiles."""
+    for y in range(0, height, tile):
+        for x in range(0, width, tile):
+            yield x, y, min(x + tile, width), min(y + tile, height)
+
+
+def _dist2_limit(threshold: float) -> int:
+    """Largest integer d2 with sqrt(d2) <= threshold, or -1 if there is none.
+
+    Comparing integer squared distances against this limit selects exactly the pixels a
+    float64 Euclidean norm compared against `threshold` would.
+    """
+    if not threshold >= 0:
+        return -1
+    limit = int(min(float(threshold) * float(threshold), _MAX_DIST2))
+    while limit < _MAX_DIST2 and math.sqrt(limit + 1) <= threshold:
+        limit += 1
+    while limit >= 0 and math.sqrt(limit) > threshold:
+        limit -= 1
+    return limit
+
+
+def make_alpha_by_chroma(
+    img: Image.Image, bg_color: Tuple[int, int, int], threshold: float, tile: int = TILE_SIZE
+) -> Image.Image:
+    """Make pixels within `threshold` (Euclidean RGB distance) of `bg_color` transparent.
+
+    The frame is processed in tiles through preallocated int32 buffers, so besides the
+    output only O(tile * tile) memory is used however large the frame is.
+    """
+    rgba = img.convert("RGBA")
+    width, height = rgba.size
+    limit = _dist2_limit(threshold)
+    alpha = np.array(rgba.getchannel("A"))
+    diff = np.empty((tile, tile), dtype=np.int32)
+    dist2 = np.empty((tile, tile), dtype=np.int32)
+    for x1, y1, x2, y2 in tile_boxes(width, height, tile):
+        block = np.asarray(rgba.crop((x1, y1, x2, y2)))
+        d = diff[: y2 - y1, : x2 - x1]
+        acc = dist2[: y2 - y1, : x2 - x1]
+        for c in range(3):
+            np.subtract(block[..., c], int(bg_color[c]), out=d, dtype=np.int32)
+            if c == 0:
+                np.multiply(d, d, out=acc)
+            else:
+                np.multiply(d, d, out=d)
+                acc += d
+        alpha[y1:y2, x1:x2][acc <= limit] = 0
+    rgba.putalpha(Image.fromarray(alpha))
+    return rgba
+
+
+def process_folder(
+    input_dir: Path,
+    output_dir: Path,
+    bgcolor,
+    threshold: Union[float, str],
+    in_place: bool,
+    sample_corners: bool,
+    model_frames: int = 16,
+    fmt: str = "png",
+    bundle: bool = False,
+):
     ensure = output_dir
     ensure.mkdir(parents=True, exist_ok=True)
 
@@ -75,12 +286,39 @@ def process_folder(input_dir: Path, output_dir: Path, bgcolor, threshold: float,
         print(f"No PNGs found in {input_dir}")
         return
 
+    model = None
+    if threshold == "auto":
+        # the estimate is only valid for the key color it was computed against
+        sample_corners = sample_corners or bgcolor is None
+    if sample_corners and bgcolor is None:
+        # one key color for the whole sequence keeps keying consistent across the animation
+        model = build_background_model(png_files, max_frames=model_frames)
+        print(
+            f"Background model from {model.frames_sampled} frames: {model.color} "
+            f"(allowed drift {model.spread:.1f})"
+        )
+        # small floor so a perfectly flat background does not flag compression noise
+        drift_limit = max(model.spread, 8.0)
+    if threshold == "auto":
+        # estimated against the model's key color, so the model is built only once
+        key_color = model.color if model is not None else bgcolor
+        estimate = estimate_threshold(png_files, key_color, max_frames=model_frames)
+        threshold = estimate.threshold
+        print(
+            f"Auto threshold: {threshold:.0f} for key color {estimate.color} "
+            f"(confidence {estimate.confidence:.2f}, {estimate.background:.0%} of sampled pixels removed)"
+        )
+        if estimate.confidence < 0.5:
+            print("Warning: background and subject colors overlap; check the result or set --threshold")
+
+    bundled = []
     for p in png_files:
         img = Image.open(p)
-        if sample_corners and bgcolor is None:
-            detected = sample_background_from_corners(img)
-            print(f"Detected background color for {p.name}: {detected}")
-            bg = detected
+        if model is not None:
+            bg = model.color
+            drift = background_drift(img, model)
+            if drift > drift_limit:
+                print(f"Warning: background of {p.name} drifts {drift:.1f} from key color {model.color}")
         elif bgcolor is not None:
             bg = bgcolor
         else:
@@ -95,8 +333,25 @@ def process_folder(input_dir: Path, output_dir: Path, bgcolor, threshold: float,
         else:
             out_path = output_dir / p.name
 
-        out_img.save(out_path)
+        out_path = save_frame(out_img, out_path, fmt)
+        if in_place and out_path != p:
+            # converted to another format: replace the source frame instead of keeping both
+            img.close()
+            p.unlink()
         print(f"Saved: {out_path}")
+        if bundle:
+            bundled.append(out_img)
+
+    if bundled:
+        try:
+            bundle_path = write_bundle(bundled, output_dir / input_dir.name)
+            print(f"Wrote bundle: {bundle_path} ({len(bundled)} frames)")
+        except ValueError as e:
+            print(f"Could not write bundle: {e}")
+
+    from manifest_builder import update_manifest
+
+    update_manifest(input_dir if in_place else output_dir)
 
 
 def main():
@@ -111,19 +366,37 @@ def main():
     )
     parser.add_argument(
         "--threshold",
-        type=float,
+        type=parse_threshold,
         default=60.0,
-        help="Distance threshold in RGB space (default 60). Higher = more removed.",
+        help="Distance threshold in RGB space (default 60), or 'auto' to pick it from the folder's color distances. Higher = more removed.",
     )
     parser.add_argument(
         "--in-place",
         action="store_true",
-        help="Overwrite files in the input folder (use with caution)",
+        help="Overwrite files in the input folder (use with caution); with --format webp the PNGs are replaced",
     )
     parser.add_argument(
         "--sample-corners",
         action="store_true",
-        help="Auto-detect background color by averaging image corners (useful for letterboxed frames)",
+        help="Auto-detect one background color for the whole folder from image corners (useful for letterboxed frames)",
+    )
+    parser.add_argument(
+        "--model-frames",
+        type=int,
+        default=16,
+        help="Number of frames sampled across the sequence to build the background model (default 16)",
+    )
+
+    parser.add_argument(
+        "--format",
+        choices=FRAME_FORMATS,
+        default="png",
+        help="Output frame format: png or lossless webp (default png)",
+    )
+    parser.add_argument(
+        "--bundle",
+        action="store_true",
+        help="Also pack the processed frames into one .sprb bundle named after the input folder",
     )
 
     args = parser.parse_args()
@@ -136,7 +409,17 @@ def main():
     if args.in_place:
         output_dir = input_dir
 
-    process_folder(input_dir, output_dir, args.bgcolor, args.threshold, args.in_place, args.sample_corners)
+    process_folder(
+        input_dir,
+        output_dir,
+        args.bgcolor,
+        args.threshold,
+        args.in_place,
+        args.sample_corners,
+        args.model_frames,
+        args.format,
+        args.bundle,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,375 @@
+"""Watch folders for new or changed clips and turn them into sprite folders.
+
+Started with `python video_to_sprites.py --watch`. A clip named `<Character>_<Animation>.mp4`
+(e.g. `Kevin_Idle.mp4`) is written to `Assets/Character/<Character>/<Animation>/`. An optional
+sidecar `<clip>.json` next to it overrides the job settings, e.g.::
+
+    {"start": "0:01", "end": 3.5, "target_fps": 12, "bgcolor": [0, 255, 0], "threshold": 50,
+     "canvas_w": 512, "erode_px": 2, "character": "Kevin", "animation": "Idle"}
+
+`"threshold": "auto"` picks the threshold from the clip's color distance histogram.
+
+Clips are keyed with the same chroma-key / crop / halo pipeline as the Streamlit app. Work
+is identified by the clip's content hash plus its settings and output folder; finished keys
+are kept in a state file, so nothing is redone after a restart.
+
+The watcher only writes into (and deletes frames from) a folder that has no sprites yet or
+whose `<prefix>_job.json` it wrote itself for the same clip; hand-made sprites in any other
+folder are skipped unless `--overwrite` is given.
+"""
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from job_queue import JobManager, QueueFull, job_key
+from manifest_builder import update_manifest
+from sprite_utils import parse_time
+
+HERE = Path(__file__).resolve().parent
+REPO_ROOT = HERE.parent.parent
+DEFAULT_WATCH_DIRS = (HERE / "Videos", REPO_ROOT / "videos")
+DEFAULT_ASSETS_DIR = REPO_ROOT / "Assets" / "Character"
+DEFAULT_STATE_PATH = HERE / ".watch_state.json"
+VIDEO_EXTS = {".mp4", ".mov", ".m4v", ".webm", ".avi", ".mkv"}
+
+DEFAULT_SETTINGS = {
+    "start": 0.0,
+    "end": None,
+    "step": 1,
+    "target_fps": None,
+    "blend": False,
+    "bgcolor": None,  # None: sample a background model from the frame corners
+    "threshold": 40.0,
+    "crop_mode": "Animation Relative",
+    "canvas_w": 512,
+    "reduce_px": 0,
+    "erode_px": 0,
+    "roi": None,  # [x, y, w, h] like video_to_sprites.py --roi
+    "prefix": "sprite",
+    "format": "png",
+    "bundle": False,
+}
+TARGET_KEYS = ("character", "animation")
+
+
+def parse_clip_name(stem: str) -> Optional[Tuple[str, str]]:
+    """`Kevin_Idle` -> ("Kevin", "Idle"); None if the name has no `<Character>_<Animation>` form."""
+    name, sep, anim = stem.partition("_")
+    if not sep or not name or not anim:
+        return None
+    return name, anim
+
+
+def load_clip_settings(clip: Path, defaults: Optional[dict] = None) -> dict:
+    """Job settings for a clip: `defaults` overridden by its sidecar `<clip>.json`, if any."""
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(defaults or {})
+    sidecar = clip.with_suffix(".json")
+    if sidecar.exists():
+        with open(sidecar, "r", encoding="utf-8") as f:
+            overrides = json.load(f)
+        unknown = set(overrides) - set(DEFAULT_SETTINGS) - set(TARGET_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown settings in {sidecar.name}: {', '.join(sorted(unknown))}")
+        settings.update(overrides)
+    settings["start"] = parse_time(settings["start"]) or 0.0
+    settings["end"] = parse_time(settings["end"])
+    return settings
+
+
+def may_write_output(output_dir: Path, clip: Path, prefix: str) -> bool:
+    """True if the watcher may (re)write `output_dir` for `clip` without `--overwrite`.
+
+    That is the case when the folder holds no `<prefix>` frames or bundle yet, or when its
+    job manifest was written by the watcher from the same clip.
+    """
+    from sprite_formats import BUNDLE_EXT
+    from video_to_sprites import job_manifest_path, load_job_manifest
+
+    manifest = job_manifest_path(output_dir, prefix)
+    if manifest.exists():
+        try:
+            job = load_job_manifest(manifest)
+        except (OSError, ValueError):
+            return False
+        return job.get("writer") == "watch" and Path(job.get("source", "")).resolve() == clip.resolve()
+    if not output_dir.is_dir():
+        return True
+    has_frames = any(output_dir.glob(f"{prefix}_[0-9][0-9][0-9][0-9].*"))
+    return not has_frames and not (output_dir / prefix).with_suffix(BUNDLE_EXT).exists()
+
+
+def run_clip_job(path: str, output_dir: str, settings: dict, source_hash: str, progress=None) -> dict:
+    """Job entry point: extract, key and crop one clip into `output_dir`. Returns a summary."""
+    from PIL import Image
+
+    from chroma_key import build_background_model, estimate_threshold
+    from sprite_formats import BUNDLE_EXT, save_frame, write_bundle
+    from sprite_pipeline import extract_frames_from_video, process_frames
+    from video_to_sprites import ensure_dir, job_manifest_path, write_job_manifest
+
+    def report(fraction):
+        if progress is not None:
+            progress(fraction)
+
+    frames, fps = extract_frames_from_video(
+        path,
+        settings["start"],
+        settings["end"],
+        max(1, int(settings["step"])),
+        progress=lambda f: report(0.4 * f),
+        target_fps=settings["target_fps"],
+        blend=settings["blend"],
+    )
+    if not frames:
+        raise ValueError("No frames in the selected range")
+    if settings["bgcolor"] is not None:
+        key_rgb = tuple(int(c) for c in settings["bgcolor"])
+    else:
+        key_rgb = build_background_model(frames).color
+    threshold = settings["threshold"]
+    if threshold == "auto":
+        threshold = estimate_threshold(frames, key_rgb).threshold
+    roi = None
+    if settings["roi"] is not None:
+        x, y, w, h = (int(v) for v in settings["roi"])
+        roi = (x, y, x + w, y + h)
+    processed = process_frames(
+        frames,
+        key_rgb,
+        float(threshold),
+        settings["crop_mode"],
+        int(settings["canvas_w"]),
+        reduce_px=int(settings["reduce_px"]),
+        erode_px=int(settings["erode_px"]),
+        manual_roi=roi,
+        progress=lambda f: report(0.4 + 0.5 * f),
+    )
+
+    out = Path(output_dir)
+    ensure_dir(out)
+    prefix, fmt = settings["prefix"], settings["format"]
+    written = set()
+    for idx, img in enumerate(processed):
+        written.add(save_frame(img, out / f"{prefix}_{idx:04d}", fmt).name)
+    # frames left over from an earlier, longer version of the clip
+    for old in out.glob(f"{prefix}_[0-9][0-9][0-9][0-9].*"):
+        if old.suffix in (".png", ".webp") and old.name not in written:
+            old.unlink()
+    out_fps = fps if settings["target_fps"] else fps / max(1, int(settings["step"]))
+    if settings["bundle"]:
+        bundle_frames = []
+        for name in sorted(written):
+            with Image.open(out / name) as img:
+                bundle_frames.append(img.convert("RGBA"))
+        write_bundle(bundle_frames, out / prefix, fps=out_fps)
+    elif (out / prefix).with_suffix(BUNDLE_EXT).exists():
+        (out / prefix).with_suffix(BUNDLE_EXT).unlink()
+    write_job_manifest(
+        job_manifest_path(out, prefix),
+        {
+            # marks the folder as the watcher's, see may_write_output
+            "writer": "watch",
+            "source": str(path),
+            "source_hash": source_hash,
+            "params": settings,
+            "key_color": list(key_rgb),
+            "threshold": float(threshold),
+            "completed": list(range(len(processed))),
+        },
+    )
+    report(1.0)
+    return {"frames": len(processed), "fps": out_fps, "key_color": list(key_rgb), "threshold": float(threshold)}
+
+
+class ClipWatcher:
+    """Polls watch folders and feeds settled clips to a bounded job pool.
+
+    A clip is only queued once its size and mtime (and those of its sidecar) have not changed
+    for `settle` seconds, so files that are still being copied or rendered are left alone.
+    Output folders with sprites the watcher did not write are skipped unless `overwrite`.
+    """
+
+    def __init__(
+        self,
+        watch_dirs=DEFAULT_WATCH_DIRS,
+        assets_dir=DEFAULT_ASSETS_DIR,
+        state_path=DEFAULT_STATE_PATH,
+        jobs: int = 2,
+        settle: float = 2.0,
+        defaults: Optional[dict] = None,
+        overwrite: bool = False,
+    ):
+        self.watch_dirs = [Path(d) for d in watch_dirs]
+        self.assets_dir = Path(assets_dir)
+        self.state_path = Path(state_path)
+        self.settle = settle
+        self.defaults = defaults or {}
+        self.overwrite = overwrite
+        self.state = self._load_state()
+        self.jobs = JobManager(max_workers=jobs, max_pending=jobs, max_results=jobs)
+        # path -> (signature, monotonic time it was first seen with that signature)
+        self._seen: Dict[Path, Tuple[tuple, float]] = {}
+        # path -> signature that has been dealt with (queued, skipped or failed)
+        self._handled: Dict[Path, tuple] = {}
+        # job key -> (clip, signature, output dir)
+        self._in_flight: Dict[str, Tuple[Path, tuple, Path]] = {}
+
+    def _load_state(self) -> dict:
+        state = {"files": {}, "done": {}, "failed": {}}
+        if self.state_path.exists():
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state.update(json.load(f))
+        return state
+
+    def _save_state(self):
+        from video_to_sprites import write_job_manifest
+
+        write_job_manifest(self.state_path, self.state)
+
+    def clips(self) -> List[Path]:
+        found = []
+        for d in self.watch_dirs:
+            if d.is_dir():
+                found.extend(p for p in sorted(d.iterdir()) if p.suffix.lower() in VIDEO_EXTS and p.is_file())
+        return found
+
+    def _signature(self, clip: Path) -> Optional[tuple]:
+        try:
+            st = clip.stat()
+        except OSError:
+            return None
+        sidecar = clip.with_suffix(".json")
+        side = None
+        if sidecar.exists():
+            sst = sidecar.stat()
+            side = (sst.st_size, sst.st_mtime_ns)
+        return (st.st_size, st.st_mtime_ns, side)
+
+    def _settled(self, clip: Path, sig: tuple, now: float) -> bool:
+        prev = self._seen.get(clip)
+        if prev is None or prev[0] != sig:
+            self._seen[clip] = (sig, now)
+            return False
+        if sig[0] == 0 or now - prev[1] < self.settle:
+            return False
+        try:
+            # writers on Windows hold the file open exclusively until they are done
+            with open(clip, "rb"):
+                pass
+        except OSError:
+            return False
+        return True
+
+    def _content_hash(self, clip: Path, sig: tuple) -> str:
+        from video_to_sprites import file_sha256
+
+        cached = self.state["files"].get(str(clip))
+        if cached and cached["size"] == sig[0] and cached["mtime_ns"] == sig[1]:
+            return cached["hash"]
+        digest = file_sha256(clip)
+        self.state["files"][str(clip)] = {"size": sig[0], "mtime_ns": sig[1], "hash": digest}
+        return digest
+
+    def _output_dir(self, clip: Path, settings: dict) -> Optional[Path]:
+        target = parse_clip_name(clip.stem)
+        name = settings.get("character") or (target and target[0])
+        anim = settings.get("animation") or (target and target[1])
+        if not name or not anim:
+            return None
+        return self.assets_dir / name / anim
+
+    def _queue(self, clip: Path, sig: tuple):
+        try:
+            settings = load_clip_settings(clip, self.defaults)
+        except (OSError, ValueError) as e:
+            print(f"[watch] {clip.name}: bad sidecar settings: {e}")
+            self._handled[clip] = sig
+            return
+        output_dir = self._output_dir(clip, settings)
+        if output_dir is None:
+            print(f"[watch] {clip.name}: skipped, name it <Character>_<Animation>{clip.suffix} or set character/animation in its sidecar")
+            self._handled[clip] = sig
+            return
+        if any(out == output_dir for _, _, out in self._in_flight.values()):
+            # another clip is writing the same folder; try again once it is done
+            return
+        if not self.overwrite and not may_write_output(output_dir, clip, settings["prefix"]):
+            print(f"[watch] {clip.name}: skipped, {output_dir} has sprites not written by --watch from this clip (--overwrite replaces them)")
+            self._handled[clip] = sig
+            return
+        source_hash = self._content_hash(clip, sig)
+        self._save_state()
+        job_settings = {k: v for k, v in settings.items() if k not in TARGET_KEYS}
+        rel_out = output_dir.relative_to(self.assets_dir).as_posix()
+        key = job_key("watch", source_hash, {"settings": job_settings, "output": rel_out})
+        done = self.state["done"].get(key)
+        if done and output_dir.is_dir():
+            self._handled[clip] = sig
+            return
+        if key in self.state["failed"]:
+            self._handled[clip] = sig
+            return
+        try:
+            self.jobs.submit(key, run_clip_job, str(clip), str(output_dir), job_settings, source_hash)
+        except QueueFull:
+            return
+        print(f"[watch] {clip.name}: queued -> {output_dir}")
+        self._handled[clip] = sig
+        self._in_flight[key] = (clip, sig, output_dir)
+
+    def _collect(self):
+        for key, (clip, sig, output_dir) in list(self._in_flight.items()):
+            status = self.jobs.status(key)
+            if status["state"] in ("queued", "running"):
+                continue
+            del self._in_flight[key]
+            if status["state"] == "done":
+                result = self.jobs.result(key) or {}
+                self.state["done"][key] = {
+                    "clip": str(clip),
+                    "output": str(output_dir),
+                    "frames": result.get("frames"),
+                    "finished": time.strftime("%Y-%m-%d %H:%M:%S"),
+                }
+                print(f"[watch] {clip.name}: wrote {result.get('frames')} frames to {output_dir}")
+                update_manifest(output_dir)
+            elif status["state"] == "failed":
+                self.state["failed"][key] = {"clip": str(clip), "error": status["error"]}
+                print(f"[watch] {clip.name}: failed: {status['error']}")
+            else:
+                # cancelled: look at the clip again on the next scan
+                self._handled.pop(clip, None)
+            self._save_state()
+
+    def poll(self) -> bool:
+        """One scan: queue settled clips and collect finished jobs. Returns True while busy."""
+        self._collect()
+        now = time.monotonic()
+        waiting = False
+        for clip in self.clips():
+            sig = self._signature(clip)
+            if sig is None or self._handled.get(clip) == sig:
+                continue
+            if self._settled(clip, sig, now):
+                self._queue(clip, sig)
+            if self._handled.get(clip) != sig:
+                waiting = True
+        return waiting or bool(self._in_flight)
+
+    def run(self, interval: float = 2.0, once: bool = False):
+        """Poll until interrupted; with `once`, stop when every current clip is handled."""
+        dirs = ", ".join(str(d) for d in self.watch_dirs)
+        print(f"[watch] Watching {dirs} -> {self.assets_dir} ({self.jobs.max_workers} parallel jobs)")
+        try:
+            while True:
+                busy = self.poll()
+                if once and not busy:
+                    break
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            print("[watch] Stopping.")
+        finally:
+            self.jobs.shutdown()
+            self._save_state()
@@ -0,0 +1,324 @@
+"""Decoded video frames in POSIX shared memory, shared by app sessions and pool workers.
+
+Each frame is one RGBA segment whose name is derived from (video hash, frame id, size), so
+any process can find a frame without asking the app. Extract jobs write the frames they
+decode and return small `FrameRef`s instead of pickled pixels; the app maps every segment
+once and hands sessions read-only PIL images backed by that mapping; export jobs map the
+same segments instead of decoding the video again.
+
+The app process owns the segments: every finished extraction is registered with
+`FrameCache` as soon as its job returns, whether or not a session ever leases it. The cache
+counts how many session leases use each frame and unlinks unused frames, least recently
+used first, once the total exceeds the byte budget. The budget (2 GiB, or
+$SPRITE_FRAME_CACHE_BYTES) is capped at half the free space of /dev/shm, which is only
+64 MB in a default Docker container; extract jobs fall back to returning pixels when
+/dev/shm has no room for their frames.
+
+On platforms without POSIX shared memory semantics (Windows frees a segment as soon as its
+creator closes it) `SHARED_MEMORY` is False and extract jobs return frames as before.
+"""
+import hashlib
+import os
+import shutil
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from multiprocessing import shared_memory
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from PIL import Image
+
+SHARED_MEMORY = os.name == "posix"
+# Frames not leased by any session are evicted above this many bytes
+DEFAULT_BUDGET = 2 * 1024 ** 3
+BUDGET_ENV = "SPRITE_FRAME_CACHE_BYTES"
+SHM_DIR = "/dev/shm"
+# Share of the free space in SHM_DIR the cache may fill; a full tmpfs kills writers with SIGBUS
+SHM_FRACTION = 0.5
+# Registered frames are kept at least this long so the extracting session can lease them
+ADOPT_GRACE_S = 60.0
+# Segments end in one flag byte that is set once the pixels are written
+_READY = 1
+
+
+class FrameRef(NamedTuple):
+    name: str
+    width: int
+    height: int
+
+    @property
+    def nbytes(self) -> int:
+        return self.width * self.height * 4
+
+
+def shm_free() -> Optional[int]:
+    """Free bytes in the shared memory filesystem, or None where it cannot be measured."""
+    try:
+        return shutil.disk_usage(SHM_DIR).free
+    except OSError:
+        return None
+
+
+def default_budget() -> int:
+    """$SPRITE_FRAME_CACHE_BYTES (default 2 GiB), capped at a fraction of the free shared memory."""
+    budget = int(os.environ.get(BUDGET_ENV) or DEFAULT_BUDGET)
+    free = shm_free()
+    if free is not None:
+        budget = min(budget, int(free * SHM_FRACTION))
+    return budget
+
+
+def shm_has_room(nbytes: int) -> bool:
+    """True if `nbytes` of new segments stay within the share of shared memory the cache may use."""
+    free = shm_free()
+    return free is None or nbytes <= free * SHM_FRACTION
+
+
+def frame_name(video_hash: str, frame_id: str, size) -> str:
+    """Segment name of a decoded frame (short enough for macOS's 31 character limit)."""
+    digest = hashlib.sha256(f"{video_hash}:{frame_id}:{size[0]}x{size[1]}".encode("utf-8")).hexdigest()
+    return "spf_" + digest[:24]
+
+
+def _wait_ready(shm: shared_memory.SharedMemory, nbytes: int, timeout: float = 10.0):
+    # another process created the segment and may still be copying into it
+    deadline = time.monotonic() + timeout
+    while shm.buf[nbytes] != _READY:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Shared frame {shm.name} was never completed")
+        time.sleep(0.005)
+
+
+def store_frame(
+    img: Image.Image, video_hash: str, frame_id: str, created: Optional[List[FrameRef]] = None
+) -> FrameRef:
+    """Copy an RGBA frame into shared memory unless that frame is already there.
+
+    Appends the ref to `created` if this call created the segment.
+    """
+    ref = FrameRef(frame_name(video_hash, frame_id, img.size), img.width, img.height)
+    try:
+        shm = shared_memory.SharedMemory(ref.name, create=True, size=ref.nbytes + 1)
+    except FileExistsError:
+        shm = shared_memory.SharedMemory(ref.name)
+        try:
+            _wait_ready(shm, ref.nbytes)
+        finally:
+            shm.close()
+        return ref
+    if created is not None:
+        created.append(ref)
+    try:
+        shm.buf[: ref.nbytes] = img.convert("RGBA").tobytes()
+        shm.buf[ref.nbytes] = _READY
+    finally:
+        shm.close()
+    return ref
+
+
+def unlink_frames(refs: Sequence[FrameRef]):
+    """Remove segments that no cache owns yet, e.g. those of a job that did not finish."""
+    for ref in refs:
+        try:
+            shm = shared_memory.SharedMemory(ref.name)
+        except FileNotFoundError:
+            continue
+        shm.close()
+        shm.unlink()
+
+
+def _image(shm: shared_memory.SharedMemory, ref: FrameRef) -> Image.Image:
+    # zero copy: PIL marks buffer-backed images read-only and copies before any in-place change
+    return Image.frombuffer("RGBA", (ref.width, ref.height), shm.buf[: ref.nbytes], "raw", "RGBA", 0, 1)
+
+
+# Segments mapped by this (worker) process; see open_frames / release_frames
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+_closing: List[shared_memory.SharedMemory] = []
+
+
+def _close_later(shm: shared_memory.SharedMemory) -> bool:
+    """Close a mapping, or keep it for a later attempt while images still use it."""
+    try:
+        shm.close()
+        return True
+    except BufferError:
+        _closing.append(shm)
+        return False
+
+
+def open_frames(refs: Sequence[FrameRef]) -> List[Image.Image]:
+    """Map shared frames in a worker. Raises FileNotFoundError if one was evicted."""
+    frames = []
+    for ref in refs:
+        shm = _attached.get(ref.name)
+        if shm is None:
+            shm = shared_memory.SharedMemory(ref.name)
+            _attached[ref.name] = shm
+        _wait_ready(shm, ref.nbytes)
+        frames.append(_image(shm, ref))
+    return frames
+
+
+def release_frames(refs: Sequence[FrameRef]):
+    """Unmap frames opened with `open_frames` once the job no longer uses them."""
+    for shm in list(_closing):
+        _closing.remove(shm)
+        _close_later(shm)
+    for ref in refs:
+        shm = _attached.pop(ref.name, None)
+        if shm is not None:
+            _close_later(shm)
+
+
+class _Entry:
+    __slots__ = ("shm", "ref", "leases", "grace_until")
+
+    def __init__(self, shm: shared_memory.SharedMemory, ref: FrameRef):
+        self.shm = shm
+        self.ref = ref
+        self.leases = 0
+        self.grace_until = 0.0
+
+
+class FrameLease:
+    """A session's hold on a list of shared frames; released when it is garbage collected."""
+
+    def __init__(self, cache: "FrameCache", refs: Sequence[FrameRef], frames: List[Image.Image]):
+        self.refs = list(refs)
+        self.frames = frames
+        # GC can run inside the cache's own lock, so only queue the release here
+        weakref.finalize(self, cache._released.append, [r.name for r in self.refs])
+
+
+class FrameCache:
+    """App-side index of shared frames with per-frame lease counts and an LRU byte budget.
+
+    Frames leased by a session, or registered within the last `ADOPT_GRACE_S` seconds, are
+    never evicted, so the budget can be exceeded while sessions hold more than it allows;
+    other frames stay cached for the next session until the budget needs their space.
+    """
+
+    def __init__(self, budget: Optional[int] = None):
+        self.budget = default_budget() if budget is None else budget
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._released: deque = deque()
+        self._closing: List[shared_memory.SharedMemory] = []
+
+    def lease(self, refs: Sequence[FrameRef]) -> FrameLease:
+        """Map the frames (once per process) and hold them until the lease is dropped.
+
+        Raises FileNotFoundError if a frame was evicted before it could be leased.
+        """
+        frames = []
+        with self._lock:
+            self._drain_released()
+            leased = []
+            try:
+                for ref in refs:
+                    entry = self._entries.get(ref.name)
+                    if entry is None:
+                        shm = shared_memory.SharedMemory(ref.name)
+                        entry = _Entry(shm, ref)
+                        self._entries[ref.name] = entry
+                        self._bytes += ref.nbytes
+                    _wait_ready(entry.shm, ref.nbytes)
+                    entry.leases += 1
+                    entry.grace_until = 0.0
+                    leased.append(entry)
+                    self._entries.move_to_end(ref.name)
+                    frames.append(_image(entry.shm, ref))
+            except (FileNotFoundError, TimeoutError):
+                for entry in leased:
+                    entry.leases -= 1
+                raise
+            self._evict()
+        return FrameLease(self, refs, frames)
+
+    def adopt(self, refs: Sequence[FrameRef]):
+        """Count the frames of a finished extraction against the budget.
+
+        Called when the job returns, so frames of extractions that are superseded or never
+        collected are evicted like any other unused frame once their grace period is over.
+        """
+        with self._lock:
+            self._drain_released()
+            until = time.monotonic() + ADOPT_GRACE_S
+            for ref in refs:
+                entry = self._entries.get(ref.name)
+                if entry is None:
+                    try:
+                        shm = shared_memory.SharedMemory(ref.name)
+                    except FileNotFoundError:
+                        continue
+                    entry = _Entry(shm, ref)
+                    self._entries[ref.name] = entry
+                    self._bytes += ref.nbytes
+                if entry.leases == 0:
+                    entry.grace_until = until
+                self._entries.move_to_end(ref.name)
+            self._evict()
+
+    def _drain_released(self):
+        while self._released:
+            for name in self._released.popleft():
+                entry = self._entries.get(name)
+                if entry is not None and entry.leases > 0:
+                    entry.leases -= 1
+
+    def _evict(self):
+        for shm in list(self._closing):
+            self._closing.remove(shm)
+            self._close(shm)
+        now = time.monotonic()
+        for name in list(self._entries):
+            if self._bytes <= self.budget:
+                break
+            entry = self._entries[name]
+            if entry.leases > 0 or entry.grace_until > now:
+                continue
+            del self._entries[name]
+            self._bytes -= entry.ref.nbytes
+            try:
+                entry.shm.unlink()
+            except FileNotFoundError:
+                pass
+            self._close(entry.shm)
+
+    def _close(self, shm: shared_memory.SharedMemory):
+        try:
+            shm.close()
+        except BufferError:
+            # an image of a released lease is still alive somewhere; try again next time
+            self._closing.append(shm)
+
+    def trim(self):
+        """Apply pending lease releases and evict down to the budget."""
+        with self._lock:
+            self._drain_released()
+            self._evict()
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._drain_released()
+            return {
+                "frames": len(self._entries),
+                "bytes": self._bytes,
+                "leased_bytes": sum(e.ref.nbytes for e in self._entries.values() if e.leases > 0),
+                "budget": self.budget,
+            }
+
+    def clear(self):
+        """Unlink every segment (app shutdown)."""
+        with self._lock:
+            for entry in self._entries.values():
+                try:
+                    entry.shm.unlink()
+                except FileNotFoundError:
+                    pass
+                self._close(entry.shm)
+            self._entries.clear()
+            self._bytes = 0
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import logging
+import multiprocessing as mp
+import os
+import sys
+import threading
+import types
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+log = logging.getLogger(__name__)
+
+
+class QueueFull(RuntimeError):
+    pass
+
+
+class JobCancelled(RuntimeError):
+    pass
+
+
+def job_key(kind: str, video_hash: str, params: dict) -> str:
+    """Identical jobs (same kind, video content and parameters) share one key."""
+    payload = json.dumps({"kind": kind, "video": video_hash, "params": params}, sort_keys=True, default=list)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+_main_swap_lock = threading.Lock()
+
+
+@contextmanager
+def _plain_main():
+    # Streamlit runs the app script as __main__, and spawned processes re-run __main__ on
+    # startup. Hide it while child processes are started so they only import this module.
+    with _main_swap_lock:
+        main = sys.modules.get("__main__")
+        sys.modules["__main__"] = types.ModuleType("__main__")
+        try:
+            yield
+        finally:
+            sys.modules["__main__"] = main
+
+
+def _run_job(fn: Callable, key: str, progress, cancel, args: tuple, kwargs: dict):
+    # Runs inside a pool worker. The job reports progress through `report`, which is also
+    # where a cancellation request from the app is noticed.
+    def report(fraction: float):
+        if cancel.get(key):
+            raise JobCancelled(key)
+        progress[key] = float(fraction)
+
+    return fn(*args, progress=report, **kwargs)
+
+
+class JobManager:
+    """Bounded job queue served by one process pool shared by every app session.
+
+    Jobs are identified by their key, so submitting a job that is already queued, running or
+    cached returns the existing one. At most `max_pending` jobs are queued or running at once
+    and `max_workers` run in parallel; finished results are kept in a small LRU cache.
+
+    Because a job may be shared, every submit of a pending job registers a waiter, and
+    `cancel(key, waiter)` only stops the job once no other waiter is left.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: int = 8, max_results: int = 16):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_pending = max_pending
+        self.max_results = max_results
+        # spawn, not fork: the Streamlit server is multi-threaded
+        ctx = mp.get_context("spawn")
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=ctx)
+        with _plain_main():
+            self._manager = ctx.Manager()
+        self._progress = self._manager.dict()
+        self._cancel = self._manager.dict()
+        self._lock = threading.Lock()
+        self._futures: Dict[str, Future] = {}
+        self._results: "OrderedDict[str, object]" = OrderedDict()
+        # status of recently failed or cancelled jobs, bounded like the results
+        self._ended: "OrderedDict[str, dict]" = OrderedDict()
+        # job key -> callbacks for its result, see on_result
+        self._hooks: Dict[str, List[Callable]] = {}
+        # job key -> callers still interested in the pending job, see cancel
+        self._waiters: Dict[str, set] = {}
+
+    def submit(self, key: str, fn: Callable, *args, waiter: Optional[str] = None, **kwargs) -> str:
+        """Queue `fn(*args, progress=..., **kwargs)` in the pool and return its job id.
+
+        `waiter` identifies the caller (e.g. an app session) for `cancel`; anonymous
+        submissions can only be cancelled without a waiter.
+        """
+        waiter = object() if waiter is None else waiter
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return key
+            fut = self._futures.get(key)
+            if fut is not None and not fut.done():
+                self._waiters.setdefault(key, set()).add(waiter)
+                # a cancellation the worker has not noticed yet no longer applies
+                self._cancel.pop(key, None)
+                return key
+            active = sum(1 for f in self._futures.values() if not f.done())
+            if active >= self.max_pending:
+                raise QueueFull(f"{active} jobs already queued or running")
+            self._ended.pop(key, None)
+            self._cancel.pop(key, None)
+            self._progress[key] = 0.0
+            # workers are started lazily by submit()
+            with _plain_main():
+                fut = self._executor.submit(_run_job, fn, key, self._progress, self._cancel, args, kwargs)
+            self._futures[key] = fut
+            self._waiters[key] = {waiter}
+        fut.add_done_callback(lambda f: self._on_done(key, f))
+        return key
+
+    def on_result(self, key: str, fn: Callable):
+        """Call `fn(result)` once when the job `key` succeeds, even if no session collects it.
+
+        Runs right away if the result is already cached; dropped if the job fails, is
+        cancelled or is unknown.
+        """
+        with self._lock:
+            if key in self._results:
+                result = self._results[key]
+            elif key in self._futures:
+                self._hooks.setdefault(key, []).append(fn)
+                return
+            else:
+                return
+        fn(result)
+
+    def _on_done(self, key: str, fut: Future):
+        with self._lock:
+            if self._futures.get(key) is not fut:
+                return
+            # every outcome: the future and its Manager entries are no longer needed
+            del self._futures[key]
+            self._progress.pop(key, None)
+            self._cancel.pop(key, None)
+            hooks = self._hooks.pop(key, [])
+            self._waiters.pop(key, None)
+            err = None if fut.cancelled() else fut.exception()
+            if fut.cancelled() or isinstance(err, JobCancelled):
+                self._ended[key] = {"state": "cancelled", "progress": 0.0, "error": None}
+            elif err is not None:
+                self._ended[key] = {"state": "failed", "progress": 0.0, "error": str(err)}
+            else:
+                self._results[key] = fut.result()
+                self._results.move_to_end(key)
+            for cache in (self._results, self._ended):
+                while len(cache) > self.max_results:
+                    cache.popitem(last=False)
+        if fut.cancelled() or err is not None:
+            return
+        for fn in hooks:
+            try:
+                fn(fut.result())
+            except Exception:
+                log.exception("Result callback of job %s failed", key[:12])
+
+    def status(self, key: str) -> dict:
+        """Return {"state", "progress", "error"}; state is queued/running/done/failed/cancelled/unknown."""
+        with self._lock:
+            if key in self._results:
+                return {"state": "done", "progress": 1.0, "error": None}
+            if key in self._ended:
+                return dict(self._ended[key])
+            fut = self._futures.get(key)
+        if fut is None:
+            return {"state": "unknown", "progress": 0.0, "error": None}
+        if fut.done():
+            # finished but the done callback has not recorded the outcome yet
+            return {"state": "running", "progress": 1.0, "error": None}
+        state = "running" if fut.running() else "queued"
+        return {"state": state, "progress": float(self._progress.get(key, 0.0)), "error": None}
+
+    def result(self, key: str):
+        """Return the cached result of a finished job, or None if it is unknown or evicted."""
+        with self._lock:
+            return self._results.get(key)
+
+    def forget(self, key: str):
+        """Drop a cached result, so the next submit of `key` runs the job again."""
+        with self._lock:
+            self._results.pop(key, None)
+
+    def cancel(self, key: str, waiter: Optional[str] = None):
+        """Stop the job `key` for `waiter`, or for everyone if no waiter is given.
+
+        A job that other waiters still wait for keeps running.
+        """
+        with self._lock:
+            fut = self._futures.get(key)
+            waiters = self._waiters.get(key)
+            if waiter is not None and waiters is not None:
+                waiters.discard(waiter)
+                if waiters:
+                    return
+        if fut is None or fut.done():
+            return
+        if not fut.cancel():
+            # already running: the worker stops at its next progress report
+            with self._lock:
+                if self._futures.get(key) is fut:
+                    self._cancel[key] = True
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._manager.shutdown()
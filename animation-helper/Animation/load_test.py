@@ -0,0 +1,280 @@
+"""Headless load test for streamlit_app.py.
+
+    python load_test.py --sessions 4
+    python load_test.py --sessions 8 --json load_8.json
+
+Simulates N artists with Streamlit's testing API (no browser, no network). Each session
+uploads one of the bundled sample clips (through the same content-addressed cache as a real
+upload), moves the trim slider, extracts frames, moves the tolerance and erosion sliders
+and exports a sprite sheet.
+
+AppTest swaps process-global state (runtime, config) on every run, so sessions cannot share
+a process; each one runs in its own child process, all released at the same moment. Every
+child therefore has its own job pool, which makes the CPU contention an upper bound of what
+one server process with a shared pool would see.
+
+Reported: latency percentiles of interactive reruns (job waits excluded), time spent
+waiting for extract and export jobs, export throughput, and memory per session (session
+process plus its pool workers, after the app's imports).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+HERE = Path(__file__).resolve().parent
+APP_PATH = HERE / "streamlit_app.py"
+DEFAULT_CLIPS = [
+    HERE.parent.parent / "videos" / "Kevin_Idle.mp4",
+    HERE.parent.parent / "videos" / "Kevin_Jab.mp4",
+    *sorted((HERE / "Videos").glob("*.mp4")),
+]
+# run_every of the app's job progress fragments
+POLL_INTERVAL = 0.5
+
+
+def _rss_bytes(pid: Optional[int] = None) -> Optional[int]:
+    """Resident memory of a process (Linux), or None where it cannot be read."""
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _total_rss() -> Optional[int]:
+    """Resident memory of this process plus its live child processes (the job pool)."""
+    own = _rss_bytes()
+    if own is None:
+        return None
+    return own + sum(_rss_bytes(p.pid) or 0 for p in multiprocessing.active_children())
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * q / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+class Session:
+    """One simulated artist driving its own AppTest instance."""
+
+    def __init__(self, clip: Path, timeout: float, poll_limit: int):
+        from streamlit.testing.v1 import AppTest
+
+        self.clip = clip
+        self.poll_limit = poll_limit
+        self.at = AppTest.from_file(str(APP_PATH), default_timeout=timeout)
+        self.latencies: List[float] = []
+        self.waits: Dict[str, float] = {}
+        self.errors: List[str] = []
+
+    def _run(self, action=None) -> float:
+        t0 = time.perf_counter()
+        (action() if action is not None else self.at).run()
+        elapsed = time.perf_counter() - t0
+        self.errors.extend(str(e.value) for e in self.at.exception)
+        return elapsed
+
+    def interact(self, action=None):
+        self.latencies.append(self._run(action))
+
+    def start_job(self, name: str, action, done) -> bool:
+        """Trigger a job and rerun until `done()`; the whole time counts as a job wait.
+
+        The app polls a job in flight from a fragment, which AppTest does not rerun on its
+        own, so poll the page at the fragment's interval instead.
+        """
+        t0 = time.perf_counter()
+        self._run(action)
+        for _ in range(self.poll_limit):
+            if done():
+                self.waits[name] = time.perf_counter() - t0
+                return True
+            time.sleep(POLL_INTERVAL)
+            self._run()
+        self.errors.append(f"{name} did not finish")
+        return False
+
+    def button(self, label: str):
+        return next(b for b in self.at.button if b.label == label)
+
+    def upload(self):
+        # AppTest cannot drive st.file_uploader, so do what the upload handler does
+        from upload_cache import probe_video, store_upload
+
+        path = store_upload(self.clip.read_bytes(), self.clip.suffix)
+        self.at.session_state.video_path = str(path)
+        self.at.session_state.video_duration = probe_video(path)["duration"]
+
+    def scenario(self, slider_moves: int):
+        self.upload()
+        self.interact()
+        duration = self.at.session_state.video_duration
+        self.interact(lambda: self.at.slider(key="trim_range").set_value((0.0, min(duration, 2.0))))
+        if not self.start_job(
+            "extract",
+            lambda: self.button("Extract Frames for Editing").click(),
+            lambda: "video_frames" in self.at.session_state,
+        ):
+            return
+        for i in range(slider_moves):
+            self.interact(lambda: self.at.slider(key="chroma_tol").set_value(30 + 10 * (i % 5)))
+            erosion = next(s for s in self.at.slider if s.label == "Erosion Amount (px)")
+            self.interact(lambda: erosion.set_value(i % 3))
+        self.start_job(
+            "export",
+            lambda: self.button("Download Sprite Sheet").click(),
+            lambda: bool(self.at.get("download_button")),
+        )
+
+
+def child(clip: Path, slider_moves: int, timeout: float, poll_limit: int, start_at: float):
+    """Run one session and print its measurements as the last line of stdout."""
+    import streamlit.logger
+
+    # AppTest runs without a server; its "no runtime" warnings are noise here
+    streamlit.logger.set_log_level("error")
+    os.chdir(HERE)
+    session = Session(clip, timeout, poll_limit)
+    # first page load (imports, job pool start-up) is not timed, as on a warm server
+    session._run()
+    base_rss = _total_rss()
+    time.sleep(max(0.0, start_at - time.time()))
+    started_at = time.time()
+    try:
+        session.scenario(slider_moves)
+    except Exception as e:  # a crashed session is a result, not a harness failure
+        session.errors.append(repr(e))
+    # measured with the session still open, as it would be in a browser tab
+    end_rss = _total_rss()
+    print(
+        json.dumps(
+            {
+                "latencies": session.latencies,
+                "waits": session.waits,
+                "errors": session.errors,
+                "base_rss": base_rss,
+                "end_rss": end_rss,
+                "started_at": started_at,
+                "finished_at": time.time(),
+            }
+        )
+    )
+
+
+def run_load_test(sessions: int, clips: List[Path], slider_moves: int, timeout: float, poll_limit: int) -> dict:
+    # children import and build their AppTest first, then all start together
+    start_at = time.time() + 10.0 + sessions
+    procs = []
+    for i in range(sessions):
+        clip = clips[i % len(clips)]
+        cmd = [
+            sys.executable, str(Path(__file__).resolve()), "--child", str(clip),
+            "--slider-moves", str(slider_moves), "--timeout", str(timeout),
+            "--poll-limit", str(poll_limit), "--start-at", str(start_at),
+        ]
+        # files, not pipes: a chatty child must not block while we wait on another
+        out, err = tempfile.TemporaryFile("w+"), tempfile.TemporaryFile("w+")
+        procs.append((clip, subprocess.Popen(cmd, cwd=HERE, stdout=out, stderr=err), out, err))
+
+    reports = []
+    errors: List[str] = []
+    for clip, proc, out_file, err_file in procs:
+        proc.wait()
+        out_file.seek(0)
+        err_file.seek(0)
+        out, err = out_file.read(), err_file.read()
+        out_file.close()
+        err_file.close()
+        try:
+            report = json.loads(out.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            tail = err.strip().splitlines()[-1:] or ["no output"]
+            errors.append(f"{clip.name}: session process failed ({tail[0]})")
+            continue
+        errors.extend(f"{clip.name}: {e}" for e in report["errors"])
+        reports.append(report)
+    wall = max((r["finished_at"] for r in reports), default=0.0) - min((r["started_at"] for r in reports), default=0.0)
+
+    latencies = [x for r in reports for x in r["latencies"]]
+    extract = [r["waits"]["extract"] for r in reports if "extract" in r["waits"]]
+    export = [r["waits"]["export"] for r in reports if "export" in r["waits"]]
+    mem = [r["end_rss"] - r["base_rss"] for r in reports if r["base_rss"] and r["end_rss"]]
+    return {
+        "sessions": sessions,
+        "wall_s": wall,
+        "reruns": len(latencies),
+        "rerun_ms": {q: percentile(latencies, q) * 1000 for q in (50, 90, 95, 99)},
+        "rerun_max_ms": max(latencies) * 1000 if latencies else float("nan"),
+        "extract_wait_s": {"median": statistics.median(extract) if extract else None, "max": max(extract, default=None)},
+        "export_wait_s": {"median": statistics.median(export) if export else None, "max": max(export, default=None)},
+        "exports": len(export),
+        "exports_per_min": len(export) / wall * 60 if wall > 0 else 0.0,
+        "rss_per_session_mb": statistics.mean(mem) / 2 ** 20 if mem else None,
+        "rss_per_session_max_mb": max(mem) / 2 ** 20 if mem else None,
+        "errors": errors,
+    }
+
+
+def print_report(r: dict):
+    print(f"{r['sessions']} sessions, {r['reruns']} interactive reruns in {r['wall_s']:.1f}s")
+    ms = r["rerun_ms"]
+    print(
+        f"  rerun latency ms: p50 {ms[50]:.0f}  p90 {ms[90]:.0f}  p95 {ms[95]:.0f}  p99 {ms[99]:.0f}  max {r['rerun_max_ms']:.0f}"
+    )
+    for name in ("extract", "export"):
+        w = r[f"{name}_wait_s"]
+        if w["median"] is not None:
+            print(f"  {name} wait s: median {w['median']:.2f}  max {w['max']:.2f}")
+    print(f"  exports: {r['exports']} ({r['exports_per_min']:.1f}/min)")
+    if r["rss_per_session_mb"] is not None:
+        print(
+            f"  memory per session: {r['rss_per_session_mb']:.0f} MB mean, {r['rss_per_session_max_mb']:.0f} MB max "
+            f"(incl. pool workers)"
+        )
+    else:
+        print("  memory: not available on this platform")
+    for e in r["errors"]:
+        print(f"  ERROR {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless multi-session load test for the Streamlit app.")
+    parser.add_argument("--sessions", "-n", type=int, default=4, help="Concurrent sessions (default 4)")
+    parser.add_argument("--clips", nargs="+", default=None, help="Video clips to upload (default: the bundled samples)")
+    parser.add_argument("--slider-moves", type=int, default=3, help="Tolerance/erosion changes per session (default 3)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Timeout of a single rerun in seconds")
+    parser.add_argument("--poll-limit", type=int, default=400, help="Reruns to wait for a job before giving up")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--start-at", type=float, default=0.0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    os.environ.setdefault("STREAMLIT_BROWSER_GATHER_USAGE_STATS", "false")
+    if args.child:
+        child(Path(args.child), args.slider_moves, args.timeout, args.poll_limit, args.start_at)
+        return
+    clips = [Path(c).resolve() for c in args.clips] if args.clips else [c for c in DEFAULT_CLIPS if c.exists()]
+    if not clips:
+        print("No sample clips found.")
+        sys.exit(1)
+    result = run_load_test(max(1, args.sessions), clips, args.slider_moves, args.timeout, args.poll_limit)
+    print_report(result)
+    if args.json:
+        Path(args.json).write_text(json.dumps(result, indent=2), encoding="utf-8")
+    sys.exit(1 if result["errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import argparse
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from chroma_key import make_alpha_by_chroma, parse_color
+from sprite_utils import parse_time
+
+
+class LoopCandidate(NamedTuple):
+    start: int  # first frame of the loop
+    end: int  # frame that should match `start`; the loop plays start..end-1
+    score: float  # seam cost relative to a typical frame-to-frame step (lower is better)
+
+
+def frame_signature(
+    img: Image.Image, key_rgb: Optional[Tuple[int, int, int]] = None, tol: float = 40.0, size: int = 32
+) -> np.ndarray:
+    """Compact signature of one frame: a size x size thumbnail, keyed if `key_rgb` is given.
+
+    With a key color the RGB values are premultiplied by the keyed alpha, so background noise
+    does not count as motion.
+    """
+    small = img.convert("RGB").resize((size, size), Image.BILINEAR, reducing_gap=2.0)
+    if key_rgb is None:
+        return np.asarray(small, dtype=np.float32).reshape(-1) / 255.0
+    keyed = np.asarray(make_alpha_by_chroma(small, key_rgb, tol), dtype=np.float32) / 255.0
+    alpha = keyed[..., 3:4]
+    return np.concatenate([(keyed[..., :3] * alpha).reshape(-1), alpha.reshape(-1)])
+
+
+def frame_signatures(
+    frames: Iterable[Image.Image], key_rgb: Optional[Tuple[int, int, int]] = None, tol: float = 40.0, size: int = 32
+) -> np.ndarray:
+    return np.stack([frame_signature(f, key_rgb, tol, size) for f in frames])
+
+
+def video_signatures(
+    path: str,
+    start_s: float,
+    end_s: Optional[float],
+    key_rgb: Optional[Tuple[int, int, int]] = None,
+    tol: float = 40.0,
+    size: int = 32,
+    progress=None,
+) -> Tuple[np.ndarray, float]:
+    """Signatures of every frame in the trimmed range from a single decode pass.
+
+    Only the thumbnails are kept, so memory stays small even for long ranges. Returns
+    (signatures, fps).
+    """
+    import imageio
+
+    reader = imageio.get_reader(path)
+    try:
+        fps = float(reader.get_meta_data().get("fps", 30.0))
+        start_frame = int(start_s * fps) if start_s else 0
+        end_frame = int(end_s * fps) if end_s is not None else None
+        sigs = []
+        for idx, frame in enumerate(reader):
+            if idx < start_frame:
+                continue
+            if end_frame is not None and idx > end_frame:
+                break
+            sigs.append(frame_signature(Image.fromarray(frame), key_rgb, tol, size))
+            if progress is not None and end_frame is not None:
+                progress((idx - start_frame + 1) / max(1, end_frame - start_frame + 1))
+    finally:
+        reader.close()
+    if not sigs:
+        return np.zeros((0, 0), dtype=np.float32), fps
+    return np.stack(sigs), fps
+
+
+def distance_matrix(sigs: np.ndarray) -> np.ndarray:
+    """Pairwise RMS distance between all signatures, computed as one matrix product."""
+    sq = np.einsum("ij,ij->i", sigs, sigs)
+    d2 = sq[:, None] + sq[None, :] - 2.0 * (sigs @ sigs.T)
+    np.maximum(d2, 0.0, out=d2)
+    return np.sqrt(d2 / max(1, sigs.shape[1]))
+
+
+def find_loops(dist: np.ndarray, min_len: int = 4, top_k: int = 5) -> List[LoopCandidate]:
+    """Rank seamless loops: ranges whose frame after the last looks like the first.
+
+    The seam cost of loop [i, j) is dist[i, j], divided by the median distance between
+    consecutive frames so that 1.0 means "as smooth as a normal step". Candidates whose
+    start and end are both within `min_len // 2` frames of a better one are suppressed.
+    """
+    n = dist.shape[0]
+    if n <= min_len:
+        return []
+    steps = np.diagonal(dist, offset=1)
+    typical = float(np.median(steps)) if steps.size else 0.0
+    typical = max(typical, 1e-6)
+    i, j = np.triu_indices(n, k=max(1, min_len))
+    scores = dist[i, j] / typical
+    order = np.argsort(scores, kind="stable")
+    near = max(1, min_len // 2)
+    picked: List[LoopCandidate] = []
+    for k in order:
+        s, e = int(i[k]), int(j[k])
+        if any(abs(s - c.start) <= near and abs(e - c.end) <= near for c in picked):
+            continue
+        picked.append(LoopCandidate(s, e, float(scores[k])))
+        if len(picked) >= top_k:
+            break
+    return picked
+
+
+def minimal_subset(dist: np.ndarray, start: int, end: int, min_change: float = 0.5) -> List[int]:
+    """Frames of loop [start, end) with near-duplicates dropped.
+
+    A frame is kept when it differs from the last kept frame by at least `min_change` times
+    the median consecutive-frame distance of the loop.
+    """
+    if end - start <= 1:
+        return list(range(start, end))
+    steps = np.diagonal(dist, offset=1)[start : end - 1]
+    threshold = min_change * max(float(np.median(steps)), 1e-6)
+    kept = [start]
+    for k in range(start + 1, end):
+        if dist[kept[-1], k] >= threshold:
+            kept.append(k)
+    return kept
+
+
+def run_loop_job(
+    path: str,
+    start_s: float,
+    end_s: Optional[float],
+    key_rgb: Optional[Tuple[int, int, int]] = None,
+    tol: float = 40.0,
+    min_len: int = 6,
+    top_k: int = 5,
+    progress=None,
+) -> List[dict]:
+    """Job entry point: loop candidates for the trimmed range, with times in seconds."""
+    sigs, fps = video_signatures(path, start_s, end_s, key_rgb, tol, progress=progress)
+    if len(sigs) == 0:
+        return []
+    dist = distance_matrix(sigs)
+    start_frame = int(start_s * fps) if start_s else 0
+    out = []
+    for c in find_loops(dist, min_len=min_len, top_k=top_k):
+        out.append(
+            {
+                # mid-frame times of the first and last frame of the loop, so trimming to
+                # them extracts exactly start..end-1
+                "start_s": (start_frame + c.start + 0.5) / fps,
+                "end_s": (start_frame + c.end - 0.5) / fps,
+                "frames": c.end - c.start,
+                "unique_frames": len(minimal_subset(dist, c.start, c.end)),
+                "score": c.score,
+            }
+        )
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Propose seamless loop ranges for a video clip.")
+    parser.add_argument("--input", "-i", required=True, help="Input video file path")
+    parser.add_argument("--start", default=None, help="Start time (seconds or MM:SS)")
+    parser.add_argument("--end", default=None, help="End time (seconds or MM:SS)")
+    parser.add_argument("--bgcolor", type=parse_color, default=None, help="Key color 'R,G,B' to ignore the background")
+    parser.add_argument("--threshold", type=float, default=40.0, help="Key tolerance used with --bgcolor (default 40)")
+    parser.add_argument("--min-frames", type=int, default=6, help="Shortest loop length in frames (default 6)")
+    parser.add_argument("--top", type=int, default=5, help="Number of candidates to print (default 5)")
+    args = parser.parse_args()
+
+    loops = run_loop_job(
+        args.input,
+        parse_time(args.start) or 0.0,
+        parse_time(args.end),
+        args.bgcolor,
+        args.threshold,
+        min_len=args.min_frames,
+        top_k=args.top,
+    )
+    if not loops:
+        print("No loop found in this range.")
+    for c in loops:
+        print(
+            f"{c['start_s']:.3f}s - {c['end_s']:.3f}s "
+            f"({c['frames']} frames, {c['unique_frames']} after dedup) seam cost {c['score']:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
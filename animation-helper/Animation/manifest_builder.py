@@ -0,0 +1,321 @@
+"""Build `public/character-manifest.json` from the sprite folders in `Assets/Character`.
+
+    python manifest_builder.py
+
+Every `Assets/Character/<Name>/<Animation>/` folder (Walk, Idle, Jab, Duck, Jump, Block) with
+PNG or WebP frames becomes a `<animation>Frames` list of the character's entry, in the
+schema the game already reads. Per animation the entry also gets an `animations` record
+with the frame count, frame size, the trim box of every frame (alpha > 8) and `aliases`
+for frames whose content duplicates an earlier frame (frame index -> index of the first
+identical frame). A `.sprb` bundle inside the animation folder (or `<Animation>.sprb` next
+to it) that is not older than the frames goes into the character's `bundles` and replaces
+that animation's frame list, since the game's bundle loader registers the same textures.
+When a folder holds one frame in several formats (`sprite_0000.png` and `.webp`), the newest
+file is used.
+
+Facts about each frame (size, mtime, content hash, dimensions, trim box) are kept in a
+persistent index, together with the mtime and file list of every animation folder. Folders
+whose mtime is unchanged are not listed again (the exporters replace files by renaming, so
+any write changes it), and in changed folders only files whose size or mtime changed are
+opened again. Rebuilding an unchanged roster costs one stat per folder; `--rebuild` also
+picks up frames that another tool overwrote in place. Characters and fields that were added
+to the manifest by hand are kept.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+HERE = Path(__file__).resolve().parent
+REPO_ROOT = HERE.parent.parent
+DEFAULT_ASSETS_DIR = REPO_ROOT / "Assets" / "Character"
+DEFAULT_MANIFEST_PATH = REPO_ROOT / "public" / "character-manifest.json"
+DEFAULT_INDEX_PATH = HERE / ".manifest_index.json"
+INDEX_VERSION = 2
+# folders modified this recently are listed again next time: a write in the same mtime tick
+# as the scan would otherwise go unnoticed
+RACY_DIR_NS = 2_000_000_000
+
+# Manifest key order the game's loader was written against
+ANIMATIONS = ("walk", "idle", "jab", "duck", "jump", "block")
+FRAME_EXTS = {".png", ".webp"}
+BUNDLE_EXT = ".sprb"
+
+
+_NUMBER_LIST = re.compile(r"\[\n\s+(-?\d+(?:,\n\s+-?\d+)*)\n\s+\]")
+
+
+def _write_json(path: Path, data, indent: Optional[int] = 2) -> bool:
+    """Atomically write `data` as JSON; returns False (and leaves the file alone) if unchanged."""
+    text = json.dumps(data, indent=indent) + "\n"
+    if indent is not None:
+        # keep trim boxes and sizes on one line each
+        text = _NUMBER_LIST.sub(lambda m: "[" + re.sub(r",\n\s+", ", ", m.group(1)) + "]", text)
+    if path.exists() and path.read_text(encoding="utf-8") == text:
+        return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+    return True
+
+
+def inspect_frame(path: Path) -> dict:
+    """Content hash, dimensions and trim box of one frame file."""
+    from PIL import Image
+
+    from sprite_pipeline import bbox_from_alpha
+
+    data = path.read_bytes()
+    with Image.open(path) as img:
+        img.load()
+        trim = bbox_from_alpha(img)
+        width, height = img.size
+    return {
+        "hash": hashlib.sha256(data).hexdigest(),
+        "width": width,
+        "height": height,
+        "trim": list(trim) if trim is not None else None,
+    }
+
+
+class ManifestBuilder:
+    """Scans the character folders against a persistent file index."""
+
+    def __init__(
+        self,
+        assets_dir=DEFAULT_ASSETS_DIR,
+        manifest_path=DEFAULT_MANIFEST_PATH,
+        index_path=DEFAULT_INDEX_PATH,
+        root=REPO_ROOT,
+    ):
+        self.assets_dir = Path(assets_dir)
+        self.manifest_path = Path(manifest_path)
+        self.index_path = Path(index_path)
+        self.root = Path(root)
+        self.index = self._load_index()
+        self.inspected = 0
+        self.written = False
+
+    def _load_index(self) -> dict:
+        if self.index_path.exists():
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    index = json.load(f)
+                if index.get("version") == INDEX_VERSION:
+                    return index
+            except (OSError, ValueError):
+                pass
+        return {"version": INDEX_VERSION, "files": {}, "dirs": {}}
+
+    def _rel(self, path: Path) -> str:
+        try:
+            return path.relative_to(self.root).as_posix()
+        except ValueError:
+            return path.as_posix()
+
+    def _list_animation(
+        self, anim_dir: Path, dirs_seen: Dict[str, dict]
+    ) -> Tuple[dict, Optional[Dict[str, os.stat_result]]]:
+        """Frame and bundle file names of a folder, and the stats of its frames.
+
+        While the folder's mtime is unchanged the names come from the index and the stats
+        are None: no file in it was added, removed or replaced.
+        """
+        rel_dir = self._rel(anim_dir)
+        mtime_ns = anim_dir.stat().st_mtime_ns
+        known = self.index["dirs"].get(rel_dir)
+        if known is not None and known["mtime_ns"] == mtime_ns:
+            dirs_seen[rel_dir] = known
+            return known, None
+        with os.scandir(anim_dir) as it:
+            files = [e for e in it if e.is_file()]
+        # one file per frame: after a format switch the older copy is stale
+        by_stem: Dict[str, Tuple[str, os.stat_result]] = {}
+        bundles = []
+        for entry in files:
+            stem, ext = os.path.splitext(entry.name)
+            if ext.lower() == BUNDLE_EXT:
+                bundles.append(entry.name)
+            if ext.lower() not in FRAME_EXTS:
+                continue
+            st = entry.stat()
+            prev = by_stem.get(stem)
+            if prev is None or st.st_mtime_ns > prev[1].st_mtime_ns:
+                by_stem[stem] = (entry.name, st)
+        listing = {
+            "mtime_ns": mtime_ns if time.time_ns() - mtime_ns > RACY_DIR_NS else None,
+            "frames": [by_stem[stem][0] for stem in sorted(by_stem)],
+            "bundles": sorted(bundles),
+        }
+        dirs_seen[rel_dir] = listing
+        return listing, dict(by_stem.values())
+
+    def _scan_animation(
+        self,
+        anim_dir: Path,
+        listing: dict,
+        stats: Optional[Dict[str, os.stat_result]],
+        files_seen: Dict[str, dict],
+    ) -> Optional[Tuple[list, dict]]:
+        frames = []
+        for name in listing["frames"]:
+            rel = self._rel(anim_dir / name)
+            known = self.index["files"].get(rel)
+            if known is None or stats is not None:
+                st = stats[name] if stats is not None else (anim_dir / name).stat()
+                if known is None or known["size"] != st.st_size or known["mtime_ns"] != st.st_mtime_ns:
+                    known = dict(inspect_frame(anim_dir / name), size=st.st_size, mtime_ns=st.st_mtime_ns)
+                    self.inspected += 1
+            files_seen[rel] = known
+            frames.append((rel, known))
+        if not frames:
+            return None
+
+        paths = [rel for rel, _ in frames]
+        first_by_hash: Dict[str, int] = {}
+        aliases = {}
+        for i, (_, info) in enumerate(frames):
+            first = first_by_hash.setdefault(info["hash"], i)
+            if first != i:
+                aliases[str(i)] = first
+        width, height = frames[0][1]["width"], frames[0][1]["height"]
+        info = {
+            "frameCount": len(frames),
+            "frameWidth": width,
+            "frameHeight": height,
+            "trim": [f["trim"] for _, f in frames],
+            "aliases": aliases,
+        }
+        if any((f["width"], f["height"]) != (width, height) for _, f in frames):
+            info["sizes"] = [[f["width"], f["height"]] for _, f in frames]
+        return paths, info
+
+    def _find_bundle(
+        self, anim_dir: Path, listing: dict, frames: list, files_seen: Dict[str, dict]
+    ) -> Optional[str]:
+        """Newest bundle of an animation, unless the frames were written after it."""
+        candidates = [anim_dir / name for name in listing["bundles"]]
+        beside = anim_dir.with_name(anim_dir.name + BUNDLE_EXT)
+        if beside.is_file():
+            candidates.append(beside)
+        if not candidates:
+            return None
+        bundle = max(candidates, key=lambda p: p.stat().st_mtime_ns)
+        newest_frame = max(files_seen[rel]["mtime_ns"] for rel in frames)
+        if bundle.stat().st_mtime_ns < newest_frame:
+            return None
+        return self._rel(bundle)
+
+    def scan(self) -> Dict[str, dict]:
+        """Generated manifest entries by character name."""
+        characters = {}
+        files_seen: Dict[str, dict] = {}
+        dirs_seen: Dict[str, dict] = {}
+        if self.assets_dir.is_dir():
+            for char_dir in sorted(p for p in self.assets_dir.iterdir() if p.is_dir()):
+                anim_dirs = {p.name.lower(): p for p in char_dir.iterdir() if p.is_dir()}
+                entry = {"name": char_dir.name, "path": self._rel(char_dir)}
+                animations = {}
+                bundles = {}
+                for anim in ANIMATIONS:
+                    result = None
+                    if anim in anim_dirs:
+                        listing, stats = self._list_animation(anim_dirs[anim], dirs_seen)
+                        result = self._scan_animation(anim_dirs[anim], listing, stats, files_seen)
+                    entry[f"{anim}Frames"] = result[0] if result else []
+                    if result:
+                        animations[anim] = result[1]
+                        bundle = self._find_bundle(anim_dirs[anim], listing, result[0], files_seen)
+                        if bundle is not None:
+                            # the bundle registers the same textures; do not load the frames too
+                            bundles[anim] = bundle
+                            entry[f"{anim}Frames"] = []
+                if bundles:
+                    entry["bundles"] = bundles
+                if animations:
+                    entry["animations"] = animations
+                    characters[char_dir.name] = entry
+        # forget deleted files and folders
+        self.index["files"] = files_seen
+        self.index["dirs"] = dirs_seen
+        return characters
+
+    def build(self) -> dict:
+        """Merge the scan into the existing manifest and write it and the index if they changed."""
+        generated = self.scan()
+        existing = []
+        if self.manifest_path.exists():
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                existing = json.load(f).get("characters", [])
+        characters = []
+        for old in existing:
+            new = generated.pop(old.get("name"), None)
+            if new is None:
+                # keep hand-maintained entries; generated ones (with "animations") were deleted
+                if "animations" not in old:
+                    characters.append(old)
+                continue
+            merged = dict(new)
+            for key, value in old.items():
+                if key not in new and not (key.endswith("Frames") or key in ("animations", "bundles")):
+                    merged[key] = value
+            # hand-added bundles are kept for animations without generated frames
+            kept = {a: url for a, url in old.get("bundles", {}).items() if a not in new["animations"]}
+            if kept:
+                merged["bundles"] = dict(kept, **new.get("bundles", {}))
+            characters.append(merged)
+        characters.extend(generated[name] for name in sorted(generated))
+        manifest = {"characters": characters}
+        self.written = _write_json(self.manifest_path, manifest)
+        _write_json(self.index_path, self.index, indent=None)
+        return manifest
+
+
+def update_manifest(output_dir=None) -> Optional[dict]:
+    """Refresh the game manifest after sprites were written to `output_dir`.
+
+    Does nothing when `output_dir` is outside `Assets/Character`. Errors are reported but
+    never fail the export that triggered the update.
+    """
+    if output_dir is not None:
+        out = Path(output_dir).resolve()
+        if out != DEFAULT_ASSETS_DIR and DEFAULT_ASSETS_DIR not in out.parents:
+            return None
+    builder = ManifestBuilder()
+    try:
+        manifest = builder.build()
+    except (OSError, ValueError) as e:
+        print(f"Could not update {builder.manifest_path}: {e}")
+        return None
+    if builder.written:
+        print(f"Updated {builder.manifest_path} ({builder.inspected} frames re-indexed)")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build public/character-manifest.json from Assets/Character.")
+    parser.add_argument("--assets-dir", default=str(DEFAULT_ASSETS_DIR), help="Character folders (default Assets/Character)")
+    parser.add_argument("--manifest", default=str(DEFAULT_MANIFEST_PATH), help="Manifest to write (default public/character-manifest.json)")
+    parser.add_argument("--index", default=str(DEFAULT_INDEX_PATH), help="Persistent file index (default .manifest_index.json)")
+    parser.add_argument("--rebuild", action="store_true", help="Ignore the index and re-read every frame")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    builder = ManifestBuilder(args.assets_dir, args.manifest, args.index)
+    if args.rebuild:
+        builder.index = {"version": INDEX_VERSION, "files": {}, "dirs": {}}
+    manifest = builder.build()
+    frames = sum(a["frameCount"] for c in manifest["characters"] for a in c.get("animations", {}).values())
+    print(
+        f"{len(manifest['characters'])} characters, {frames} frames, {builder.inspected} re-indexed, "
+        f"{'written' if builder.written else 'unchanged'} in {time.perf_counter() - t0:.3f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Speculative export processing while the artist edits.
+
+On every rerun the app submits the current frame selection and export settings as a
+precompute job to the shared `JobManager` pool and cancels the session's previous one, so
+speculative work competes for workers like any other job instead of running inside the
+server process. The job maps the extracted frames from shared memory, keys each one and
+crops, resizes and halo-cleans them onto the export canvases.
+
+Keyed frames are written to shared memory under a name derived from the frame, key color
+and tolerance, so a job that only changes the crop, size or halo settings maps them instead
+of keying again. The canvases go to shared memory as well and the job returns `FrameRef`s;
+an export pressed afterwards only runs an encode job that maps them. The app registers every
+returned segment with its `FrameCache`, which evicts them like extracted frames; a job that
+is cancelled or fails removes the segments it wrote itself.
+"""
+from typing import List, Optional, Sequence, Tuple
+
+from PIL import Image
+
+from frame_cache import (
+    FrameRef,
+    frame_name,
+    open_frames,
+    release_frames,
+    shm_has_room,
+    store_frame,
+    unlink_frames,
+)
+from sprite_pipeline import ProgressFn, bbox_from_alpha, fit_frames, key_frame, needs_bboxes
+
+# Namespace of keyed frames in the shared frame cache (in place of a video hash)
+KEYED_NAMESPACE = "keyed"
+
+
+def keyed_ref(source: FrameRef, frame_id: str, target_rgb, tol: float) -> Tuple[FrameRef, str]:
+    """Shared memory ref of `source` keyed with (`target_rgb`, `tol`), and its frame id."""
+    keyed_id = f"{frame_id}:{tuple(int(c) for c in target_rgb)}:{float(tol)}"
+    size = (source.width, source.height)
+    return FrameRef(frame_name(KEYED_NAMESPACE, keyed_id, size), source.width, source.height), keyed_id
+
+
+def _open_keyed(ref: FrameRef) -> Optional[Image.Image]:
+    try:
+        return open_frames([ref])[0]
+    except (FileNotFoundError, TimeoutError):
+        release_frames([ref])
+        return None
+
+
+def run_precompute_job(
+    refs: Sequence[FrameRef],
+    frame_ids: Sequence[str],
+    settings: dict,
+    key: str,
+    progress: ProgressFn = None,
+) -> Tuple[List[FrameRef], List[FrameRef]]:
+    """Job entry point: process shared frames with `process_frames` settings.
+
+    `frame_ids` identify the frames' content (e.g. extract job key and index). Returns the
+    refs of the export canvases (stored under `key`) and of the keyed frames.
+    """
+    def report(fraction):
+        # also where a newer request from the session cancels this job
+        if progress is not None:
+            progress(fraction)
+
+    target_rgb, tol = tuple(settings["target_rgb"]), float(settings["tol"])
+    with_bbox = needs_bboxes(settings["crop_mode"], settings.get("manual_roi"))
+    canvas_bytes = len(refs) * settings["canvas_w"] ** 2 * 4
+    if not shm_has_room(sum(r.nbytes for r in refs) + canvas_bytes):
+        raise MemoryError("Not enough shared memory for the export frames")
+    mapped: List[FrameRef] = []
+    # segments this job wrote; no cache adopts them unless it returns
+    created: List[FrameRef] = []
+    keyed, bboxes, keyed_refs = [], [], []
+    try:
+        try:
+            for i, (ref, frame_id) in enumerate(zip(refs, frame_ids)):
+                kref, keyed_id = keyed_ref(ref, frame_id, target_rgb, tol)
+                img = _open_keyed(kref)
+                if img is not None:
+                    mapped.append(kref)
+                    bbox = bbox_from_alpha(img) if with_bbox else None
+                else:
+                    source = open_frames([ref])[0]
+                    mapped.append(ref)
+                    img, bbox = key_frame(source, target_rgb, tol, with_bbox)
+                    del source
+                    store_frame(img, KEYED_NAMESPACE, keyed_id, created)
+                keyed.append(img)
+                bboxes.append(bbox)
+                keyed_refs.append(kref)
+                report(0.8 * (i + 1) / len(refs))
+            processed = fit_frames(
+                keyed,
+                bboxes,
+                settings["crop_mode"],
+                settings["canvas_w"],
+                reduce_px=settings.get("reduce_px", 0),
+                erode_px=settings.get("erode_px", 0),
+                manual_roi=settings.get("manual_roi"),
+            )
+        finally:
+            # drop the views into shared memory before unmapping it
+            keyed.clear()
+            img = None
+            release_frames(mapped)
+        report(0.9)
+        canvas_refs = [store_frame(img, key, str(i), created) for i, img in enumerate(processed)]
+        report(1.0)
+    except BaseException:
+        # cancelled or failed: nothing will adopt or evict what was written so far
+        unlink_frames(created)
+        raise
+    return canvas_refs, keyed_refs
@@ -0,0 +1,220 @@
+"""Output formats for sprite frames.
+
+Besides PNG, frames can be written as lossless WebP, and a whole animation can be packed
+into one `.sprb` bundle that the game loads with `src/utils/SpriteBundleLoader.ts`.
+
+Bundle layout (all integers little-endian)::
+
+    b"SPRB" | u8 version | 3 reserved bytes | u32 header length | header JSON | zlib payload
+
+The header lists the full frame size and, per frame, its trim box inside the frame and the
+offsets of its data in the decompressed payload. Each frame stores the RGB bytes of its trim
+box (zeroed where alpha is 0) as differences from the row above (mod 256, which deflates
+much better than raw pixels), followed by its alpha plane run-length encoded as
+(run length 1-255, value) byte pairs.
+"""
+import io
+import json
+import os
+import struct
+import zlib
+from pathlib import Path
+from typing import BinaryIO, List, Optional, Sequence, Union
+
+import numpy as np
+from PIL import Image
+
+FRAME_FORMATS = ("png", "webp")
+BUNDLE_MAGIC = b"SPRB"
+BUNDLE_VERSION = 1
+BUNDLE_EXT = ".sprb"
+
+
+def _replace_bytes(path: Path, data: bytes):
+    # write-then-rename: readers never see a partial file, and the folder's mtime changes
+    # even when a frame is overwritten (manifest_builder skips folders whose mtime did not)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def encode_frame(img: Image.Image, fmt: str = "png") -> bytes:
+    """Encode one RGBA frame as PNG or lossless WebP."""
+    buf = io.BytesIO()
+    if fmt == "png":
+        img.save(buf, format="PNG")
+    elif fmt == "webp":
+        # invisible RGB values are discarded (exact=False), which only helps compression
+        img.save(buf, format="WEBP", lossless=True, quality=100, method=4)
+    else:
+        raise ValueError(f"Unknown frame format: {fmt}")
+    return buf.getvalue()
+
+
+def save_frame(img: Image.Image, path: Union[str, Path], fmt: str = "png") -> Path:
+    """Save one RGBA frame as PNG or lossless WebP; `path` gets the matching extension."""
+    data = encode_frame(img, fmt)
+    path = Path(path).with_suffix(f".{fmt}")
+    _replace_bytes(path, data)
+    return path
+
+
+def rle_encode(values: np.ndarray) -> bytes:
+    """Run-length encode a uint8 array as (run length, value) byte pairs, runs capped at 255."""
+    flat = np.ascontiguousarray(values, dtype=np.uint8).reshape(-1)
+    if flat.size == 0:
+        return b""
+    starts = np.flatnonzero(np.diff(flat)) + 1
+    starts = np.concatenate(([0], starts))
+    lengths = np.diff(np.concatenate((starts, [flat.size])))
+    run_values = flat[starts]
+    # split runs longer than 255 into full 255 chunks plus a remainder
+    reps = (lengths + 254) // 255
+    out_values = np.repeat(run_values, reps)
+    out_lengths = np.full(out_values.size, 255, dtype=np.int64)
+    last = np.cumsum(reps) - 1
+    out_lengths[last] = lengths - 255 * (reps - 1)
+    return np.stack([out_lengths.astype(np.uint8), out_values], axis=1).tobytes()
+
+
+def rle_decode(data: bytes, size: int) -> np.ndarray:
+    pairs = np.frombuffer(data, dtype=np.uint8).reshape(-1, 2)
+    out = np.repeat(pairs[:, 1], pairs[:, 0].astype(np.int64))
+    if out.size != size:
+        raise ValueError(f"RLE data decodes to {out.size} values, expected {size}")
+    return out
+
+
+def encode_bundle(frames: Sequence[Image.Image], fps: Optional[float] = None, level: int = 6) -> bytes:
+    """Pack equally sized RGBA frames into one bundle with trimmed frames and RLE alpha."""
+    if not frames:
+        raise ValueError("No frames to bundle")
+    width, height = frames[0].size
+    entries = []
+    chunks = []
+    offset = 0
+    for img in frames:
+        if img.size != (width, height):
+            raise ValueError("All frames in a bundle must have the same size")
+        arr = np.asarray(img.convert("RGBA"))
+        alpha = arr[..., 3]
+        rows = np.flatnonzero(alpha.any(axis=1))
+        if rows.size == 0:
+            entries.append({"x": 0, "y": 0, "w": 0, "h": 0, "rgb": [offset, 0], "alpha": [offset, 0]})
+            continue
+        cols = np.flatnonzero(alpha.any(axis=0))
+        y1, y2 = int(rows[0]), int(rows[-1]) + 1
+        x1, x2 = int(cols[0]), int(cols[-1]) + 1
+        trimmed = arr[y1:y2, x1:x2]
+        rgb = trimmed[..., :3].copy()
+        rgb[trimmed[..., 3] == 0] = 0
+        # "up" prediction: first row as is, then each row minus the one above (wrapping)
+        rgb[1:] -= rgb[:-1].copy()
+        rgb_bytes = rgb.tobytes()
+        alpha_bytes = rle_encode(trimmed[..., 3])
+        entries.append(
+            {
+                "x": x1,
+                "y": y1,
+                "w": x2 - x1,
+                "h": y2 - y1,
+                "rgb": [offset, len(rgb_bytes)],
+                "alpha": [offset + len(rgb_bytes), len(alpha_bytes)],
+            }
+        )
+        chunks.append(rgb_bytes)
+        chunks.append(alpha_bytes)
+        offset += len(rgb_bytes) + len(alpha_bytes)
+    header = {
+        "version": BUNDLE_VERSION,
+        "frameWidth": width,
+        "frameHeight": height,
+        "fps": fps,
+        "frames": entries,
+    }
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    payload = zlib.compress(b"".join(chunks), level)
+    return (
+        BUNDLE_MAGIC
+        + struct.pack("<B3xI", BUNDLE_VERSION, len(header_bytes))
+        + header_bytes
+        + payload
+    )
+
+
+def decode_bundle(data: bytes) -> List[Image.Image]:
+    """Unpack a bundle into full-size RGBA frames (the inverse of `encode_bundle`)."""
+    if data[:4] != BUNDLE_MAGIC:
+        raise ValueError("Not a sprite bundle")
+    version, header_len = struct.unpack_from("<B3xI", data, 4)
+    if version != BUNDLE_VERSION:
+        raise ValueError(f"Unsupported bundle version {version}")
+    header = json.loads(data[12 : 12 + header_len].decode("utf-8"))
+    payload = zlib.decompress(data[12 + header_len :])
+    width, height = header["frameWidth"], header["frameHeight"]
+    frames = []
+    for f in header["frames"]:
+        arr = np.zeros((height, width, 4), dtype=np.uint8)
+        w, h = f["w"], f["h"]
+        if w and h:
+            ro, rl = f["rgb"]
+            ao, al = f["alpha"]
+            rgb = np.frombuffer(payload[ro : ro + rl], dtype=np.uint8).reshape(h, w, 3)
+            # undo the row prediction: a running sum down each column, wrapping at 256
+            rgb = np.cumsum(rgb, axis=0, dtype=np.uint8)
+            alpha = rle_decode(payload[ao : ao + al], w * h).reshape(h, w)
+            arr[f["y"] : f["y"] + h, f["x"] : f["x"] + w, :3] = rgb
+            arr[f["y"] : f["y"] + h, f["x"] : f["x"] + w, 3] = alpha
+        frames.append(Image.fromarray(arr))
+    return frames
+
+
+class PngRowWriter:
+    """Write an RGBA PNG band by band, so the whole image never has to be in memory.
+
+    Scanlines use the PNG "Up" filter (difference to the row above), which suits sprite
+    sheets, and are deflated through one streaming compressor.
+    """
+
+    def __init__(self, out: BinaryIO, width: int, height: int, level: int = 6):
+        self.out = out
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(level)
+        self._prev = np.zeros(width * 4, dtype=np.uint8)
+        out.write(b"\x89PNG\r\n\x1a\n")
+        # 8 bits per channel, color type 6 (RGBA), default compression/filter/interlace
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+
+    def _chunk(self, kind: bytes, data: bytes):
+        self.out.write(struct.pack(">I", len(data)) + kind + data)
+        self.out.write(struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+    def write_rows(self, rows: np.ndarray):
+        """Append an (n, width, 4) uint8 band of scanlines."""
+        n = rows.shape[0]
+        if rows.shape[1:] != (self.width, 4) or self.rows_written + n > self.height:
+            raise ValueError("Rows do not fit the image")
+        flat = np.ascontiguousarray(rows, dtype=np.uint8).reshape(n, self.width * 4)
+        filtered = np.empty((n, self.width * 4 + 1), dtype=np.uint8)
+        filtered[:, 0] = 2  # "Up" filter
+        np.subtract(flat[0], self._prev, out=filtered[0, 1:])
+        np.subtract(flat[1:], flat[:-1], out=filtered[1:, 1:])
+        self._prev = flat[-1].copy()
+        data = self._compressor.compress(filtered.tobytes())
+        if data:
+            self._chunk(b"IDAT", data)
+        self.rows_written += n
+
+    def close(self):
+        if self.rows_written != self.height:
+            raise ValueError(f"Wrote {self.rows_written} of {self.height} rows")
+        self._chunk(b"IDAT", self._compressor.flush())
+        self._chunk(b"IEND", b"")
+
+
+def write_bundle(frames: Sequence[Image.Image], path: Union[str, Path], fps: Optional[float] = None) -> Path:
+    path = Path(path).with_suffix(BUNDLE_EXT)
+    _replace_bytes(path, encode_bundle(frames, fps=fps))
+    return path
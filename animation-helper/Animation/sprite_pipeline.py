@@ -0,0 +1,547 @@
+import io
+import json
+import zipfile
+from math import ceil
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+from chroma_key import TILE_SIZE, make_alpha_by_chroma, sample_background_from_corners, tile_boxes
+from frame_cache import SHARED_MEMORY, FrameRef, open_frames, release_frames, shm_has_room, store_frame
+from sprite_formats import PngRowWriter, encode_bundle, encode_frame
+from sprite_utils import target_fps_plan
+from video_to_sprites import blend_frames
+
+ProgressFn = Optional[Callable[[float], None]]
+# Sheets larger than this many pixels (128 MiB as RGBA) are PNG-encoded band by band
+STREAM_SHEET_PIXELS = 32 * 1024 * 1024
+
+
+def _report(progress: ProgressFn, fraction: float):
+    if progress is not None:
+        progress(fraction)
+
+
+def extract_frames_from_video(
+    path: str,
+    start_s: float,
+    end_s: Optional[float],
+    step: int,
+    progress: ProgressFn = None,
+    target_fps: Optional[float] = None,
+    blend: bool = False,
+) -> Tuple[List[Image.Image], float]:
+    frames, fps, _ = _extract_with_ids(path, start_s, end_s, step, progress, target_fps, blend)
+    return frames, fps
+
+
+def _extract_with_ids(
+    path: str,
+    start_s: float,
+    end_s: Optional[float],
+    step: int,
+    progress: ProgressFn = None,
+    target_fps: Optional[float] = None,
+    blend: bool = False,
+) -> Tuple[List[Image.Image], float, List[str]]:
+    # ids name each frame by its source frame(s), so equal frames of different extractions match
+    import imageio
+
+    reader = imageio.get_reader(path)
+    meta = reader.get_meta_data()
+    fps = float(meta.get("fps", 30.0))
+    raw_nframes = meta.get("nframes")
+    if raw_nframes is None or raw_nframes == float('inf'):
+        total_frames = 0
+    else:
+        total_frames = int(raw_nframes)
+
+    start_frame = int(start_s * fps) if start_s else 0
+    end_frame = int(end_s * fps) if end_s is not None else (total_frames - 1 if total_frames > 0 else None)
+    frames: List[Image.Image] = []
+    ids: List[str] = []
+    if target_fps:
+        if end_frame is None:
+            end_frame = max(start_frame, int(float(meta.get("duration", 0.0)) * fps) - 1)
+        frames, ids = _extract_resampled(reader, start_frame, end_frame, fps, target_fps, blend, progress)
+        fps = float(target_fps)
+    else:
+        for idx, frame in enumerate(reader):
+            if idx < start_frame:
+                continue
+            if end_frame is not None and idx > end_frame:
+                break
+            if (idx - start_frame) % step != 0:
+                continue
+            img = Image.fromarray(frame).convert("RGBA")
+            frames.append(img)
+            ids.append(str(idx))
+            if end_frame is not None:
+                _report(progress, (idx - start_frame + 1) / max(1, end_frame - start_frame + 1))
+    try:
+        reader.close()
+    except Exception:
+        pass
+    return frames, fps, ids
+
+
+def _extract_resampled(
+    reader, start_frame, end_frame, fps, target_fps, blend, progress
+) -> Tuple[List[Image.Image], List[str]]:
+    # get_data() seeks or skips forward over raw frame bytes, so frames that are not part of
+    # the plan are never converted to arrays
+    plan = target_fps_plan(fps, start_frame, end_frame, target_fps, blend=blend)
+    frames: List[Image.Image] = []
+    ids: List[str] = []
+    decoded = {}
+    for k, entry in enumerate(plan):
+        try:
+            for f, _ in entry:
+                if f not in decoded:
+                    decoded[f] = reader.get_data(f)
+        except (IndexError, StopIteration, RuntimeError):
+            # plan ran past the real end of the video
+            break
+        frame = blend_frames([(decoded[f], w) for f, w in entry])
+        decoded = {f: d for f, d in decoded.items() if f >= entry[-1][0]}
+        frames.append(Image.fromarray(frame).convert("RGBA"))
+        ids.append(str(entry[0][0]) if len(entry) == 1 else "+".join(f"{f}*{w:.6g}" for f, w in entry))
+        _report(progress, (k + 1) / len(plan))
+    return frames, ids
+
+
+def pil_to_bytes(img: Image.Image) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _copy_tile_row(dst: np.ndarray, images: Sequence[Image.Image], tile_w: int, tile_h: int):
+    """Block-copy one row of tiles into `dst`, a (tile_h, cols * tile_w, 4) uint8 array."""
+    for c, img in enumerate(images):
+        # export frames are already tile-sized RGBA; anything else is resampled first
+        if img.size != (tile_w, tile_h):
+            img = img.resize((tile_w, tile_h), Image.LANCZOS)
+        if img.mode != "RGBA":
+            img = img.convert("RGBA")
+        dst[:, c * tile_w : (c + 1) * tile_w] = np.frombuffer(img.tobytes(), dtype=np.uint8).reshape(tile_h, tile_w, 4)
+    dst[:, len(images) * tile_w :] = 0
+    # color under fully transparent pixels is invisible; zero it so the sheet compresses well
+    np.putmask(dst.view(np.uint32), dst[..., 3:] == 0, 0)
+
+
+def iter_spritesheet_rows(images: Sequence[Image.Image], tile_w: int, tile_h: int, cols: int):
+    """Yield the sheet one row of tiles at a time as (tile_h, cols * tile_w, 4) uint8 bands.
+
+    The band buffer is allocated once and reused, so consume each band before the next.
+    """
+    band = np.empty((tile_h, cols * tile_w, 4), dtype=np.uint8)
+    for start in range(0, len(images), cols):
+        _copy_tile_row(band, images[start : start + cols], tile_w, tile_h)
+        yield band
+
+
+def make_spritesheet(images: List[Image.Image], tile_w: int, tile_h: int, cols: int) -> Image.Image:
+    """Tiles in row-major order, copied into one preallocated array (no blending)."""
+    rows = (len(images) + cols - 1) // cols
+    sheet = np.empty((rows * tile_h, cols * tile_w, 4), dtype=np.uint8)
+    for r in range(rows):
+        _copy_tile_row(sheet[r * tile_h : (r + 1) * tile_h], images[r * cols : (r + 1) * cols], tile_w, tile_h)
+    return Image.fromarray(sheet)
+
+
+def halo_remove(img: Image.Image, erode_px: int, tile: int = TILE_SIZE) -> Image.Image:
+    """Erode the alpha channel by `erode_px` (a MinFilter of size 1 + 2 * erode_px).
+
+    Works tile by tile: each tile is filtered together with an `erode_px` border of its
+    neighbours and only its inner part is kept, which gives the same result as filtering
+    the whole frame at once.
+    """
+    if erode_px <= 0:
+        return img
+    rgba = img.convert("RGBA")
+    width, height = rgba.size
+    alpha = rgba.getchannel("A")
+    eroded = Image.new("L", rgba.size)
+    # size=3 means 1px radius, size=5 means 2px radius, etc.
+    min_filter = ImageFilter.MinFilter(size=1 + 2 * erode_px)
+    for x1, y1, x2, y2 in tile_boxes(width, height, tile):
+        gx1, gy1 = max(0, x1 - erode_px), max(0, y1 - erode_px)
+        gx2, gy2 = min(width, x2 + erode_px), min(height, y2 + erode_px)
+        filtered = alpha.crop((gx1, gy1, gx2, gy2)).filter(min_filter)
+        eroded.paste(filtered.crop((x1 - gx1, y1 - gy1, x2 - gx1, y2 - gy1)), (x1, y1))
+    rgba.putalpha(eroded)
+    return rgba
+
+
+def bbox_from_alpha(img: Image.Image, tile: int = TILE_SIZE) -> Optional[Tuple[int, int, int, int]]:
+    """Bounding box (x1, y1, x2, y2) of pixels with alpha > 8, scanned tile by tile."""
+    if img.mode != "RGBA":
+        img = img.convert("RGBA")
+    box = None
+    for tx1, ty1, tx2, ty2 in tile_boxes(img.width, img.height, tile):
+        if box is not None and box[0] <= tx1 and box[1] <= ty1 and tx2 <= box[2] and ty2 <= box[3]:
+            # the tile cannot grow the box
+            continue
+        mask = np.asarray(img.crop((tx1, ty1, tx2, ty2)).getchannel("A")) > 8
+        rows = np.flatnonzero(mask.any(axis=1))
+        if rows.size == 0:
+            continue
+        cols = np.flatnonzero(mask.any(axis=0))
+        tile_box = (tx1 + int(cols[0]), ty1 + int(rows[0]), tx1 + int(cols[-1]) + 1, ty1 + int(rows[-1]) + 1)
+        if box is None:
+            box = tile_box
+        else:
+            box = (
+                min(box[0], tile_box[0]),
+                min(box[1], tile_box[1]),
+                max(box[2], tile_box[2]),
+                max(box[3], tile_box[3]),
+            )
+    return box
+
+
+def detect_roi_by_chroma(frames: List[Image.Image], tol: float = 20.0) -> Optional[Tuple[int, int, int, int]]:
+    if not frames:
+        return None
+    # sample background color from corners of first frame
+    bg = sample_background_from_corners(frames[0])
+    union_bbox = None
+    for f in frames:
+        alpha_img = make_alpha_by_chroma(f, bg, tol)
+        b = bbox_from_alpha(alpha_img)
+        if b is None:
+            continue
+        if union_bbox is None:
+            union_bbox = b
+        else:
+            x1 = min(union_bbox[0], b[0])
+            y1 = min(union_bbox[1], b[1])
+            x2 = max(union_bbox[2], b[2])
+            y2 = max(union_bbox[3], b[3])
+            union_bbox = (x1, y1, x2, y2)
+    return union_bbox
+
+
+Box = Tuple[int, int, int, int]
+
+
+def key_frame(
+    img: Image.Image, target_rgb: Tuple[int, int, int], tol: float, with_bbox: bool = True
+) -> Tuple[Image.Image, Optional[Box]]:
+    """Chroma key one frame; also returns its alpha bbox unless `with_bbox` is False."""
+    keyed = make_alpha_by_chroma(img, target_rgb, tol)
+    return keyed, bbox_from_alpha(keyed) if with_bbox else None
+
+
+def needs_bboxes(crop_mode: str, manual_roi: Optional[Box]) -> bool:
+    """Whether fit_frames() uses the per-frame bboxes for this crop mode."""
+    return crop_mode != "Animation Relative" or not manual_roi
+
+
+def process_frames(
+    images: Sequence[Image.Image],
+    target_rgb: Tuple[int, int, int],
+    tol: float,
+    crop_mode: str,
+    canvas_w: int,
+    reduce_px: int = 0,
+    erode_px: int = 0,
+    manual_roi: Optional[Tuple[int, int, int, int]] = None,
+    progress: ProgressFn = None,
+) -> List[Image.Image]:
+    """Chroma key -> compute common bbox -> crop/align -> resize -> halo, one canvas per frame."""
+    if not images:
+        return []
+    with_bbox = needs_bboxes(crop_mode, manual_roi)
+    keyed, bboxes = [], []
+    for i, img in enumerate(images):
+        k, b = key_frame(img, target_rgb, tol, with_bbox)
+        keyed.append(k)
+        bboxes.append(b)
+        _report(progress, 0.5 * (i + 1) / len(images))
+    return fit_frames(keyed, bboxes, crop_mode, canvas_w, reduce_px, erode_px, manual_roi, progress)
+
+
+def fit_frames(
+    keyed: Sequence[Image.Image],
+    bboxes: Sequence[Optional[Box]],
+    crop_mode: str,
+    canvas_w: int,
+    reduce_px: int = 0,
+    erode_px: int = 0,
+    manual_roi: Optional[Box] = None,
+    progress: ProgressFn = None,
+) -> List[Image.Image]:
+    """Crop/align keyed frames (with their alpha bboxes) onto square canvases and remove halos."""
+    if not keyed:
+        return []
+    processed = []
+    if crop_mode == "Animation Relative":
+        # prefer manually tuned ROI if present
+        if manual_roi:
+            x1, y1, x2, y2 = manual_roi
+        else:
+            # Better to use union of all frames for animation relative
+            union_bbox = None
+            for b in bboxes:
+                if b is not None:
+                    if union_bbox is None:
+                        union_bbox = b
+                    else:
+                        union_bbox = (
+                            min(union_bbox[0], b[0]),
+                            min(union_bbox[1], b[1]),
+                            max(union_bbox[2], b[2]),
+                            max(union_bbox[3], b[3])
+                        )
+
+            if union_bbox is None:
+                union_bbox = (0, 0, keyed[0].width, keyed[0].height)
+            x1, y1, x2, y2 = union_bbox
+
+        # apply reduce/trim
+        x1 = max(0, x1 - reduce_px)
+        y1 = max(0, y1 - reduce_px)
+        x2 = min(keyed[0].width, x2 + reduce_px)
+        y2 = min(keyed[0].height, y2 + reduce_px)
+
+        for p in keyed:
+            crop = p.crop((x1, y1, x2, y2))
+            # Fit into canvas_w x canvas_w, preserving aspect ratio
+            scale = min(canvas_w / max(1, crop.width), canvas_w / max(1, crop.height))
+            new_size = (int(crop.width * scale), int(crop.height * scale))
+            crop_resized = crop.resize(new_size, Image.LANCZOS)
+
+            canvas = Image.new("RGBA", (canvas_w, canvas_w), (0, 0, 0, 0))
+            off_x = (canvas_w - new_size[0]) // 2
+            off_y = (canvas_w - new_size[1]) // 2
+            canvas.paste(crop_resized, (off_x, off_y), crop_resized)
+            processed.append(canvas)
+    else:
+        # Center-Center: use the bbox of each frame and center into canvas
+        for p, b in zip(keyed, bboxes):
+            if b is None:
+                # blank -> transparent canvas
+                canvas = Image.new("RGBA", (canvas_w, canvas_w), (0, 0, 0, 0))
+                processed.append(canvas)
+                continue
+            x1, y1, x2, y2 = b
+            x1 = max(0, x1 - reduce_px)
+            y1 = max(0, y1 - reduce_px)
+            x2 = min(p.width, x2 + reduce_px)
+            y2 = min(p.height, y2 + reduce_px)
+            crop = p.crop((x1, y1, x2, y2))
+
+            # resize preserving aspect to fit canvas
+            crop.thumbnail((canvas_w, canvas_w), Image.LANCZOS)
+            canvas = Image.new("RGBA", (canvas_w, canvas_w), (0, 0, 0, 0))
+            cx = (canvas_w - crop.width) // 2
+            cy = (canvas_w - crop.height) // 2
+            canvas.paste(crop, (cx, cy), crop)
+            processed.append(canvas)
+    _report(progress, 0.75)
+
+    if erode_px > 0:
+        processed = [halo_remove(p, erode_px) for p in processed]
+    return processed
+
+
+def encode_spritesheet(processed: List[Image.Image], canvas_w: int) -> bytes:
+    """PNG sprite sheet of square `canvas_w` tiles in a near-square grid.
+
+    Sheets above STREAM_SHEET_PIXELS are compressed band by band and never held in memory
+    as a whole; smaller ones go through Pillow's encoder, which compresses a bit better.
+    """
+    cols = int(ceil(np.sqrt(len(processed))))
+    rows = (len(processed) + cols - 1) // cols
+    buf = io.BytesIO()
+    if rows * cols * canvas_w * canvas_w <= STREAM_SHEET_PIXELS:
+        make_spritesheet(processed, canvas_w, canvas_w, cols).save(buf, format="PNG")
+        return buf.getvalue()
+    writer = PngRowWriter(buf, cols * canvas_w, rows * canvas_w)
+    for band in iter_spritesheet_rows(processed, canvas_w, canvas_w, cols):
+        writer.write_rows(band)
+    writer.close()
+    return buf.getvalue()
+
+
+def encode_zip(processed: List[Image.Image], frame_format: str = "png") -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        for idx, img in enumerate(processed):
+            z.writestr(f"sprite_{idx:04d}.{frame_format}", encode_frame(img, frame_format))
+    return buf.getvalue()
+
+
+def downsample_premultiplied(img: Image.Image, size: int) -> Image.Image:
+    """Resize a square RGBA frame to size x size.
+
+    Pillow premultiplies RGBA by alpha while resampling, so the arbitrary RGB of
+    transparent pixels (often the key color) does not bleed into the edges.
+    """
+    return img.resize((size, size), Image.LANCZOS)
+
+
+def build_pyramid(processed: List[Image.Image], sizes: Sequence[int]) -> Dict[int, List[Image.Image]]:
+    """Derive every requested canvas size from frames processed once at the largest one.
+
+    `processed` must already be at max(sizes). Each smaller level is downsampled from the
+    next larger level rather than from the full size, so the total cost stays close to
+    that of a single level.
+    """
+    order = sorted(set(int(s) for s in sizes), reverse=True)
+    if not order:
+        return {}
+    if processed and processed[0].width != order[0]:
+        raise ValueError(f"Frames are {processed[0].width}px, expected the largest level {order[0]}px")
+    levels = {order[0]: list(processed)}
+    prev = levels[order[0]]
+    for size in order[1:]:
+        prev = [downsample_premultiplied(img, size) for img in prev]
+        levels[size] = prev
+    return levels
+
+
+def encode_pyramid(
+    levels: Dict[int, List[Image.Image]], frame_format: str = "png", fps: Optional[float] = None
+) -> bytes:
+    """ZIP with one folder per level (`<size>/sprite_0000.png`, ...) and `pyramid.json`."""
+    buf = io.BytesIO()
+    meta = {"fps": fps, "frameCount": 0, "levels": []}
+    with zipfile.ZipFile(buf, "w") as z:
+        for size in sorted(levels, reverse=True):
+            names = []
+            for idx, img in enumerate(levels[size]):
+                name = f"{size}/sprite_{idx:04d}.{frame_format}"
+                z.writestr(name, encode_frame(img, frame_format))
+                names.append(name)
+            meta["frameCount"] = len(names)
+            meta["levels"].append({"size": size, "frames": names})
+        z.writestr("pyramid.json", json.dumps(meta, indent=2))
+    return buf.getvalue()
+
+
+def run_extract_job(
+    path: str,
+    start_s: float,
+    end_s: Optional[float],
+    step: int,
+    target_fps: Optional[float] = None,
+    blend: bool = False,
+    progress: ProgressFn = None,
+    video_hash: Optional[str] = None,
+):
+    """Job entry point: decode the trimmed range. Returns (frames, fps).
+
+    With `video_hash` (and shared memory available) the frames are put in the shared frame
+    cache and returned as `FrameRef`s, so only names and sizes travel back to the app. When
+    shared memory has no room for them, the frames are returned as images instead.
+    """
+    frames, fps, ids = _extract_with_ids(path, start_s, end_s, step, progress, target_fps, blend)
+    nbytes = sum(img.width * img.height * 4 for img in frames)
+    if video_hash is not None and SHARED_MEMORY and shm_has_room(nbytes):
+        return [store_frame(img, video_hash, frame_id) for img, frame_id in zip(frames, ids)], fps
+    return frames, fps
+
+
+def run_export_job(
+    path: str,
+    start_s: float,
+    end_s: Optional[float],
+    step: int,
+    selected: Sequence[int],
+    settings: dict,
+    fmt: str,
+    target_fps: Optional[float] = None,
+    blend: bool = False,
+    frame_format: str = "png",
+    sizes: Optional[Sequence[int]] = None,
+    progress: ProgressFn = None,
+    shared: Optional[Tuple[Sequence[FrameRef], float]] = None,
+) -> bytes:
+    """Job entry point: export the frames of the source video.
+
+    The job is fully described by the video and its parameters, so identical exports can be
+    deduplicated by key. `shared` is the (frame refs, fps) result of the extract job: those
+    frames are mapped from shared memory, and the video is only decoded again if they have
+    been evicted. The "pyramid" format processes the frames once at the largest of `sizes`
+    and derives the other levels from it.
+    """
+    if fmt == "pyramid":
+        if not sizes:
+            raise ValueError("No pyramid sizes given")
+        settings = dict(settings, canvas_w=max(sizes))
+    refs: Sequence[FrameRef] = []
+    frames = None
+    if shared is not None:
+        refs, fps = shared
+        try:
+            frames = open_frames(refs)
+        except (FileNotFoundError, TimeoutError):
+            release_frames(refs)
+            frames = None
+    if frames is None:
+        frames, fps = extract_frames_from_video(path, start_s, end_s, step, target_fps=target_fps, blend=blend)
+    _report(progress, 0.2)
+    sel = list(selected) if selected else list(range(len(frames)))
+    sel_images = [frames[i] for i in sel if i < len(frames)]
+    del frames
+    try:
+        processed = process_frames(
+            sel_images,
+            progress=lambda f: _report(progress, 0.2 + 0.7 * f),
+            **settings,
+        )
+    finally:
+        # drop the views into shared memory before unmapping it
+        del sel_images
+        release_frames(refs)
+    out_fps = fps if target_fps else fps / max(1, step)
+    data = encode_export(processed, fmt, settings["canvas_w"], out_fps, frame_format, sizes)
+    _report(progress, 1.0)
+    return data
+
+
+def encode_export(
+    processed: List[Image.Image],
+    fmt: str,
+    canvas_w: int,
+    fps: float,
+    frame_format: str = "png",
+    sizes: Optional[Sequence[int]] = None,
+) -> bytes:
+    """Encode processed frames as a sheet, bundle, pyramid or ZIP (`fmt`)."""
+    if not processed:
+        raise ValueError("No frames remain after processing")
+    if fmt == "sheet":
+        return encode_spritesheet(processed, canvas_w)
+    if fmt == "bundle":
+        return encode_bundle(processed, fps=fps)
+    if fmt == "pyramid":
+        return encode_pyramid(build_pyramid(processed, sizes), frame_format, fps=fps)
+    return encode_zip(processed, frame_format)
+
+
+def run_encode_job(
+    refs: Sequence[FrameRef],
+    fmt: str,
+    canvas_w: int,
+    fps: float,
+    frame_format: str = "png",
+    sizes: Optional[Sequence[int]] = None,
+    progress: ProgressFn = None,
+) -> bytes:
+    """Job entry point: encode canvases a precompute job left in shared memory (see precompute.py)."""
+    processed = None
+    try:
+        processed = open_frames(refs)
+        _report(progress, 0.1)
+        data = encode_export(processed, fmt, canvas_w, fps, frame_format, sizes)
+    finally:
+        # drop the views into shared memory before unmapping it
+        processed = None
+        release_frames(refs)
+    _report(progress, 1.0)
+    return data
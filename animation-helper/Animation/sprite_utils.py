@@ -0,0 +1,54 @@
+"""Dependency-free helpers shared by the CLIs and the Streamlit app.
+
+Keep this module free of third-party imports so importing it stays instant.
+"""
+import math
+
+
+def parse_time(t):
+    """Parse a time string like 'MM:SS' or seconds as float/int."""
+    if t is None:
+        return None
+    if isinstance(t, (int, float)):
+        return float(t)
+    t = str(t)
+    if ":" in t:
+        parts = t.split(":")
+        parts = [float(p) for p in parts]
+        parts.reverse()
+        sec = 0.0
+        mul = 1.0
+        for p in parts:
+            sec += p * mul
+            mul *= 60.0
+        return sec
+    return float(t)
+
+
+def target_fps_plan(src_fps, start_frame, end_frame, target_fps, blend=False):
+    """Plan which source frames make up each output frame when resampling to `target_fps`.
+
+    Returns one list of (source_frame, weight) pairs per output frame. Output frame k sits at
+    source position start_frame + k * src_fps / target_fps; without `blend` the nearest source
+    frame is used, with `blend` the two neighbouring frames are mixed by distance.
+    """
+    if target_fps <= 0:
+        raise ValueError("target fps must be positive")
+    ratio = float(src_fps) / float(target_fps)
+    plan = []
+    k = 0
+    while True:
+        pos = start_frame + k * ratio
+        if pos > end_frame + 1e-6:
+            break
+        if blend:
+            i0 = int(math.floor(pos + 1e-6))
+            w = pos - i0
+            if w <= 1e-6 or i0 + 1 > end_frame:
+                plan.append([(i0, 1.0)])
+            else:
+                plan.append([(i0, 1.0 - w), (i0 + 1, w)])
+        else:
+            plan.append([(min(int(round(pos)), end_frame), 1.0)])
+        k += 1
+    return plan
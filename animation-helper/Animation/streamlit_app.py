@@ -1,24 +1,36 @@
+import base64
 import io
-import zipfile
+import sys
+import uuid
+from functools import partial
+from math import ceil
 from pathlib import Path
 from typing import List, Tuple, Optional
 
 import streamlit as st
-import imageio
 import numpy as np
-from PIL import Image, ImageFilter
-import base64
-from PIL import ImageDraw
+from PIL import Image, ImageDraw
+
+# Local utilities (heavy backends such as imageio are imported on first use)
+from chroma_key import estimate_threshold, make_alpha_by_chroma
+from upload_cache import UploadRegistry, probe_video, store_upload
+from frame_cache import FrameCache, FrameRef
+from precompute import run_precompute_job
+from job_queue import JobManager, QueueFull, job_key
+from loop_finder import distance_matrix, find_loops, frame_signatures, minimal_subset, run_loop_job
+from sprite_pipeline import (
+    detect_roi_by_chroma,
+    extract_frames_from_video,
+    halo_remove,
+    run_encode_job,
+    run_export_job,
+    run_extract_job,
+)
 
-# Local utilities
-from video_to_sprites import parse_time
-from chroma_key import make_alpha_by_chroma, sample_background_from_corners
+st.set_page_config(page_title="AI Character → Sprite", layout="wide")
 
 # Monkey-patch for streamlit-drawable-canvas compatibility with Streamlit 1.30+
 import streamlit.elements.image as st_image
-# Monkey-patch for streamlit-drawable-canvas compatibility with Streamlit 1.30+
-import sys
-import streamlit.elements.image as st_image
 try:
     from streamlit.elements.lib.image_utils import image_to_url as real_image_to_url
     
@@ -51,119 +63,88 @@ except Exception:
     HAS_CANVAS = False
 
 
-def extract_frames_from_video(path: str, start_s: float, end_s: Optional[float], step: int) -> Tuple[List[Image.Image], float]:
-    reader = imageio.get_reader(path)
-    meta = reader.get_meta_data()
-    fps = float(meta.get("fps", 30.0))
-    raw_nframes = meta.get("nframes")
-    if raw_nframes is None or raw_nframes == float('inf'):
-        total_frames = 0
-    else:
-        total_frames = int(raw_nframes)
-    
-    start_frame = int(start_s * fps) if start_s else 0
-    end_frame = int(end_s * fps) if end_s is not None else (total_frames - 1 if total_frames > 0 else None)
-    frames: List[Image.Image] = []
-    i = 0
-    for idx, frame in enumerate(reader):
-        if idx < start_frame:
-            continue
-        if end_frame is not None and idx > end_frame:
-            break
-        if (idx - start_frame) % step != 0:
-            continue
-        img = Image.fromarray(frame).convert("RGBA")
-        frames.append(img)
-        i += 1
-    try:
-        reader.close()
-    except Exception:
-        pass
-    return frames, fps
-
-
-def detect_roi_by_chroma(frames: List[Image.Image], tol: float = 20.0) -> Optional[Tuple[int, int, int, int]]:
-    if not frames:
-        return None
-    # sample background color from corners of first frame
-    bg = sample_background_from_corners(frames[0])
-    union_bbox = None
-    for f in frames:
-        alpha_img = make_alpha_by_chroma(f, bg, tol)
-        b = bbox_from_alpha(alpha_img)
-        if b is None:
-            continue
-        if union_bbox is None:
-            union_bbox = b
-        else:
-            x1 = min(union_bbox[0], b[0])
-            y1 = min(union_bbox[1], b[1])
-            x2 = max(union_bbox[2], b[2])
-            y2 = max(union_bbox[3], b[3])
-            union_bbox = (x1, y1, x2, y2)
-    return union_bbox
+# ------- Helpers -------
+@st.cache_resource
+def get_job_manager() -> JobManager:
+    # one pool and queue for every session of this server
+    return JobManager()
 
 
-st.set_page_config(page_title="AI Character → Sprite", layout="wide")
+@st.cache_resource
+def get_upload_registry() -> UploadRegistry:
+    # cached uploads open in live sessions, protected from eviction
+    return UploadRegistry()
 
-# Helpers
-import io
-import zipfile
-from math import ceil
-from pathlib import Path
-from typing import List, Tuple, Optional
 
-import streamlit as st
-import imageio
-import numpy as np
-from PIL import Image, ImageFilter
+@st.cache_resource
+def get_frame_cache() -> FrameCache:
+    # decoded frames in shared memory, mapped once per process for every session
+    return FrameCache()
 
-# Local utilities
-from video_to_sprites import parse_time
-from chroma_key import make_alpha_by_chroma, sample_background_from_corners
 
+def adopt_extracted(result):
+    # job result callback (pool thread): register the extract's shared frames with the cache
+    frames, _ = result
+    if frames and isinstance(frames[0], FrameRef):
+        get_frame_cache().adopt(frames)
 
-st.set_page_config(page_title="AI Character → Sprite", layout="wide")
 
+def adopt_precomputed(result):
+    # job result callback (pool thread): register the canvases and keyed frames with the cache
+    canvases, keyed = result
+    get_frame_cache().adopt(list(canvases) + list(keyed))
 
-# ------- Helpers -------
-def load_pngs(folder: Path) -> List[Path]:
-    return sorted(folder.glob("*.png"))
 
+def use_trim_range(start_s: float, end_s: float):
+    # widget callback: runs before the slider is rendered on the next rerun
+    st.session_state.trim_range = (float(start_s), float(end_s))
 
-def pil_to_bytes(img: Image.Image) -> bytes:
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    return buf.getvalue()
-
-
-def make_spritesheet(images: List[Image.Image], tile_w: int, tile_h: int, cols: int) -> Image.Image:
-    rows = (len(images) + cols - 1) // cols
-    out = Image.new("RGBA", (cols * tile_w, rows * tile_h), (0, 0, 0, 0))
-    for idx, img in enumerate(images):
-        r = idx // cols
-        c = idx % cols
-        img_resized = img.resize((tile_w, tile_h), Image.LANCZOS)
-        out.paste(img_resized, (c * tile_w, r * tile_h), img_resized)
-    return out
-
-
-def halo_remove(img: Image.Image, erode_px: int) -> Image.Image:
-    if erode_px <= 0:
-        return img
-    arr = np.array(img.convert("RGBA"))
-    alpha = arr[..., 3]
-    pil_alpha = Image.fromarray(alpha)
-    # Erosion to remove halo
-    # size=3 means 1px radius, size=5 means 2px radius, etc.
-    filter_size = 1 + 2 * erode_px
-    pil_alpha = pil_alpha.filter(ImageFilter.MinFilter(size=filter_size))
-    # Optional: slight blur to smooth edges?
-    # pil_alpha = pil_alpha.filter(ImageFilter.GaussianBlur(radius=0.5))
-    
-    new_alpha = np.array(pil_alpha)
-    arr[..., 3] = new_alpha
-    return Image.fromarray(arr)
+
+def auto_tune_key(frames: List[Image.Image]):
+    # widget callback: one histogram pass sets both the key color and the tolerance slider
+    estimate = estimate_threshold(frames)
+    st.session_state.chroma_tol = int(round(min(estimate.threshold, 150)))
+    st.session_state.chroma_color = "#%02x%02x%02x" % estimate.color
+    st.session_state.auto_key = estimate
+
+
+@st.fragment(run_every=0.5)
+def job_progress(job_id: str, label: str):
+    # polls on its own, so a job in flight does not rerun (and re-render) the whole page
+    status = jobs.status(job_id)
+    if status["state"] not in ("queued", "running"):
+        # finished: rerun the page once so it picks up the result
+        st.rerun()
+    text = f"{label}: waiting for a worker..." if status["state"] == "queued" else f"{label}..."
+    st.progress(status["progress"], text=text)
+    if st.button("Cancel", key=f"cancel_{job_id}"):
+        jobs.cancel(job_id, session_id)
+        wait = st.session_state.get("export_wait")
+        if wait and wait["precompute"] == job_id:
+            # the export was waiting for this job: cancel the export, do not fall back
+            del st.session_state["export_wait"]
+
+
+def show_job(job_id: str, label: str) -> dict:
+    """Render progress and a cancel button for a queued/running job and return its status."""
+    status = jobs.status(job_id)
+    if status["state"] in ("queued", "running"):
+        job_progress(job_id, label)
+    elif status["state"] == "failed":
+        st.error(f"{label} failed: {status['error']}")
+    elif status["state"] == "cancelled":
+        st.warning(f"{label} cancelled.")
+    return status
+
+
+@st.cache_data(show_spinner=False)
+def cached_probe_video(path: str) -> dict:
+    # cached paths are content-addressed, so the path alone identifies the metadata
+    return probe_video(path)
+
+
+def load_pngs(folder: Path) -> List[Path]:
+    return sorted(folder.glob("*.png"))
 
 
 def extract_palette(img: Image.Image, n: int = 8) -> List[Tuple[int, int, int]]:
@@ -188,6 +169,8 @@ def extract_palette(img: Image.Image, n: int = 8) -> List[Tuple[int, int, int]]:
 def make_video_bytes(frames: List[Image.Image], fps: int) -> Optional[bytes]:
     # Try mp4 via imageio (ffmpeg) then fallback to GIF
     try:
+        import imageio
+
         buf = io.BytesIO()
         with imageio.get_writer(buf, format="ffmpeg", mode="I", fps=fps) as writer:
             for f in frames:
@@ -203,20 +186,17 @@ def make_video_bytes(frames: List[Image.Image], fps: int) -> Optional[bytes]:
             return None
 
 
-def bbox_from_alpha(img: Image.Image) -> Optional[Tuple[int, int, int, int]]:
-    arr = np.array(img.convert("RGBA"))
-    alpha = arr[..., 3]
-    ys, xs = np.where(alpha > 8)
-    if len(xs) == 0:
-        return None
-    x1 = int(xs.min())
-    x2 = int(xs.max())
-    y1 = int(ys.min())
-    y2 = int(ys.max())
-    return x1, y1, x2 + 1, y2 + 1
-
-
 # ------- UI -------
+jobs = get_job_manager()
+uploads = get_upload_registry()
+frame_cache = get_frame_cache()
+# evict frames whose grace period ran out without a lease
+frame_cache.trim()
+if "session_id" not in st.session_state:
+    # this session's waiter id on shared jobs: it only cancels jobs nobody else waits for
+    st.session_state.session_id = uuid.uuid4().hex
+session_id = st.session_state.session_id
+
 st.title("AI Character Art → Animated Sprites")
 
 left, right = st.columns([3, 1])
@@ -234,42 +214,45 @@ with left:
     video_file = st.file_uploader("Upload video", type=["mp4", "mov", "webm", "avi", "mkv"])
     
     # Handle video upload/loading
-    if video_file:
-        # Save to temp file if new upload (preserve extension so imageio/ffmpeg can detect backend)
+    if video_file and st.session_state.get("upload_id") != video_file.file_id:
+        # New upload: store it once in the content-addressed cache (preserve extension so
+        # imageio/ffmpeg can detect backend). Reruns with the same upload skip this block.
         suffix = Path(video_file.name).suffix or ".mp4"
-        tmp = Path(f".streamlit_tmp_video{suffix}")
-        # Check if we need to write the file (new upload)
-        # We can't easily check if it's the *same* file content without hashing, 
-        # but we can rely on session state to know if we've processed it.
-        # For simplicity, always write if file_uploader has a value.
-        tmp.parent.mkdir(parents=True, exist_ok=True)
-        with open(tmp, "wb") as f:
-            f.write(video_file.getbuffer())
-        st.session_state.video_path = str(tmp)
-        
+        cached = store_upload(video_file.getbuffer(), suffix, in_use=uploads.in_use())
+        st.session_state.upload_id = video_file.file_id
+        st.session_state.video_path = str(cached)
+        st.session_state.pop("trim_range", None)
+        st.session_state.pop("loop_candidates", None)
+
         # Get metadata
         try:
-            reader = imageio.get_reader(st.session_state.video_path)
-            meta = reader.get_meta_data()
-            st.session_state.video_duration = float(meta.get("duration", 0.0))
-            reader.close()
+            st.session_state.video_duration = cached_probe_video(st.session_state.video_path)["duration"]
         except Exception as e:
             st.error(f"Error reading video metadata: {e}")
 
     if st.session_state.video_path:
-        st.video(st.session_state.video_path)
+        # Hold the cached file while this session uses it so other uploads cannot evict it
+        hold = st.session_state.get("upload_hold")
+        if hold is None or hold.path != Path(st.session_state.video_path).resolve():
+            st.session_state.upload_hold = uploads.hold(st.session_state.video_path)
+        else:
+            hold.touch()
+        # Serve the in-memory upload when we have it so reruns do not reread the cached file
+        st.video(video_file if video_file else st.session_state.video_path)
         
         st.subheader("Trim & Loop")
         # Range slider for trimming
         duration = st.session_state.video_duration
         if duration > 0:
+            if "trim_range" not in st.session_state:
+                st.session_state.trim_range = (0.0, min(duration, 5.0)) # Default to first 5s
             start_val, end_val = st.slider(
                 "Select Start & End Time (seconds)",
                 min_value=0.0,
                 max_value=duration,
-                value=(0.0, min(duration, 5.0)), # Default to first 5s
                 step=0.0001,
-                format="%.3f"
+                format="%.3f",
+                key="trim_range",
             )
 
             # Also allow precise numeric input for start/end seconds
@@ -304,23 +287,101 @@ with left:
                         except Exception as e:
                             st.error(f"Preview failed: {e}")
 
+            if st.button("Find Loop Points"):
+                key_hex = st.session_state.get("chroma_color")
+                key_rgb = tuple(int(key_hex.lstrip("#")[i:i+2], 16) for i in (0, 2, 4)) if key_hex else None
+                loop_params = {"start": start_val, "end": end_val, "key": key_rgb, "tol": st.session_state.get("chroma_tol", 40)}
+                try:
+                    st.session_state.loop_job = jobs.submit(
+                        job_key("loops", Path(st.session_state.video_path).stem, loop_params),
+                        run_loop_job,
+                        st.session_state.video_path,
+                        start_val,
+                        end_val,
+                        key_rgb,
+                        loop_params["tol"],
+                        waiter=session_id,
+                    )
+                except QueueFull:
+                    st.warning("All workers are busy. Try again in a moment.")
+
+            loop_job = st.session_state.get("loop_job")
+            if loop_job:
+                status = show_job(loop_job, "Finding loop points")
+                if status["state"] == "done":
+                    st.session_state.loop_candidates = jobs.result(loop_job) or []
+                    del st.session_state["loop_job"]
+                elif status["state"] not in ("queued", "running"):
+                    del st.session_state["loop_job"]
+
+            if "loop_candidates" in st.session_state:
+                if not st.session_state.loop_candidates:
+                    st.info("No seamless loop found in this range.")
+                for n, c in enumerate(st.session_state.loop_candidates):
+                    lc1, lc2 = st.columns([4, 1])
+                    lc1.write(
+                        f"{c['start_s']:.3f}s - {c['end_s']:.3f}s: {c['frames']} frames "
+                        f"({c['unique_frames']} unique), seam cost {c['score']:.2f}"
+                    )
+                    lc2.button("Use", key=f"use_loop_{n}", on_click=use_trim_range, args=(c["start_s"], c["end_s"]))
+
             with col_ext:
                 sample_step = st.number_input("Sample every Nth frame", min_value=1, value=2, step=1)
+                target_fps = st.number_input("Target FPS (0 = use every Nth frame)", min_value=0.0, max_value=120.0, value=0.0, step=1.0)
+                blend = st.checkbox("Blend between frames", value=False, disabled=target_fps <= 0)
                 if st.button("Extract Frames for Editing"):
-                    with st.spinner("Extracting full quality frames..."):
+                    extract_params = {
+                        "start": start_val,
+                        "end": end_val,
+                        # resampling to a target FPS ignores the step, so it must not split the cache
+                        "step": 1 if target_fps > 0 else int(sample_step),
+                        "target_fps": float(target_fps) or None,
+                        "blend": bool(blend and target_fps > 0),
+                    }
+                    try:
+                        st.session_state.extract_job = jobs.submit(
+                            job_key("extract", Path(st.session_state.video_path).stem, extract_params),
+                            run_extract_job,
+                            st.session_state.video_path,
+                            start_val,
+                            end_val,
+                            extract_params["step"],
+                            target_fps=extract_params["target_fps"],
+                            blend=extract_params["blend"],
+                            video_hash=Path(st.session_state.video_path).stem,
+                            waiter=session_id,
+                        )
+                        # count the shared frames against the cache budget even if this session leaves
+                        jobs.on_result(st.session_state.extract_job, adopt_extracted)
+                        st.session_state.pending_extract_params = extract_params
+                    except QueueFull:
+                        st.warning("All workers are busy. Try again in a moment.")
+
+                extract_job = st.session_state.get("extract_job")
+                if extract_job:
+                    status = show_job(extract_job, "Extracting full quality frames")
+                    if status["state"] == "done":
+                        frames, fps = jobs.result(extract_job)
+                        del st.session_state["extract_job"]
+                        lease = None
                         try:
-                            frames, fps = extract_frames_from_video(
-                                st.session_state.video_path,
-                                start_val,
-                                end_val,
-                                int(sample_step)
-                            )
+                            if frames and isinstance(frames[0], FrameRef):
+                                lease = frame_cache.lease(frames)
+                                frames = lease.frames
+                        except (FileNotFoundError, TimeoutError):
+                            jobs.forget(extract_job)
+                            st.warning("The extracted frames were evicted from the frame cache. Extract again.")
+                        else:
+                            # the lease keeps the shared frames mapped while this session holds them
+                            st.session_state.frame_lease = lease
                             st.session_state.video_frames = frames
                             st.session_state.video_fps = fps
+                            st.session_state.frames_key = extract_job
+                            st.session_state.extract_params = st.session_state.pending_extract_params
                             st.success(f"Extracted {len(frames)} frames!")
                             st.rerun()
-                        except Exception as e:
-                            st.error(f"Extraction failed: {e}")
+                    elif status["state"] not in ("queued", "running"):
+                        del st.session_state["extract_job"]
         else:
             st.warning("Could not determine video duration. Please try another file.")
 
@@ -342,6 +403,16 @@ with left:
             st.session_state.selected_indices = list(range(len(images)))
         if c2.button("Clear"):
             st.session_state.selected_indices = []
+        if c3.button("Auto-select Loop", help="Pick the most seamless loop among the extracted frames and drop near-duplicates"):
+            key_hex = st.session_state.get("chroma_color")
+            key_rgb = tuple(int(key_hex.lstrip("#")[i:i+2], 16) for i in (0, 2, 4)) if key_hex else None
+            dist = distance_matrix(frame_signatures(images, key_rgb, st.session_state.get("chroma_tol", 40)))
+            loops = find_loops(dist, min_len=min(6, max(2, len(images) // 2)), top_k=1)
+            if loops:
+                st.session_state.selected_indices = minimal_subset(dist, loops[0].start, loops[0].end)
+                st.success(f"Loop: frames {loops[0].start + 1}-{loops[0].end} (seam cost {loops[0].score:.2f})")
+            else:
+                st.warning("Not enough frames to find a loop.")
             
         # Initialize selection if needed
         if "selected_indices" not in st.session_state:
@@ -403,7 +474,26 @@ with right:
     
     sample_frame = None
     # Tolerance slider (always available)
-    tol = st.slider("Tolerance", 0, 150, 40, key="chroma_tol")
+    # default through session state, so the auto button can set it without a widget warning
+    if "chroma_tol" not in st.session_state:
+        st.session_state.chroma_tol = 40
+    tol = st.slider("Tolerance", 0, 150, key="chroma_tol")
+    if images:
+        frames_for_key = [images[i] for i in st.session_state.get("selected_indices", [])] or images
+        st.button(
+            "Auto Tolerance & Color",
+            on_click=auto_tune_key,
+            args=(frames_for_key,),
+            help="Estimate the key color and tolerance from the color distances of the selected frames",
+        )
+    auto_key = st.session_state.get("auto_key")
+    if auto_key is not None:
+        st.caption(
+            f"Auto: tolerance {auto_key.threshold:.0f}, key color {'#%02x%02x%02x' % auto_key.color}, "
+            f"confidence {auto_key.confidence:.2f} ({auto_key.background:.0%} of pixels keyed)"
+        )
+        if auto_key.confidence < 0.5:
+            st.warning("Background and subject colors overlap; check the preview and adjust by hand.")
     
     # Palette extraction
     if images and st.session_state.selected_indices:
@@ -594,120 +684,163 @@ with right:
     st.markdown("---")
     st.header("6. Export")
     
-    col_exp1, col_exp2 = st.columns(2)
-    export_sheet = col_exp1.button("Download Sprite Sheet", type="primary")
-    export_zip = col_exp2.button("Download ZIP")
-
-    if images and (export_sheet or export_zip):
-        # Use session state indices
+    frame_format = st.selectbox("ZIP frame format", ["png", "webp"], format_func=lambda f: "PNG" if f == "png" else "WebP (lossless)")
+    size_options = [24, 32, 48, 64, 96, 128, 192, 256, 512]
+    pyramid_sizes = st.multiselect(
+        "Pyramid sizes",
+        size_options,
+        default=[s for s in size_options if s in (canvas_w, canvas_w // 2, canvas_w // 4)],
+        help="Frames are processed once at the largest size; smaller sizes are downsampled from it",
+    )
+    # Current selection and settings, processed in the job pool while the artist edits
+    precompute_key = None
+    if images and st.session_state.get("extract_params"):
         sel = st.session_state.selected_indices if st.session_state.selected_indices else list(range(len(images)))
-        sel_images = [images[i] for i in sel]
-        
-        # Use session state chroma color
+        sel = [i for i in sel if i < len(images)]
         target_rgb = tuple(int(st.session_state.chroma_color.lstrip("#")[i:i+2], 16) for i in (0, 2, 4))
-
-        # Process: chroma key -> compute common bbox -> crop/align -> resize -> halo -> collect
-        processed = []
-        
-        with st.spinner("Processing frames..."):
-            # First pass: remove background
-            processed_tmp = [make_alpha_by_chroma(img, target_rgb, tol) for img in sel_images]
-
-            if crop_mode == "Animation Relative":
-                # prefer manually tuned ROI if present
-                manual_roi = st.session_state.get('roi')
-                if manual_roi:
-                    x1, y1, x2, y2 = manual_roi
+        settings = {
+            "target_rgb": target_rgb,
+            "tol": tol,
+            "crop_mode": crop_mode,
+            "canvas_w": canvas_w,
+            "reduce_px": int(reduce_px),
+            "erode_px": int(erode_px),
+            "manual_roi": st.session_state.get('roi'),
+        }
+        frames_key = st.session_state.get("frames_key", "")
+        precompute_key = job_key("precompute", frames_key, {"selected": sel, "settings": settings})
+        lease = st.session_state.get("frame_lease")
+        # speculative work needs the extracted frames in shared memory
+        if lease is not None and st.session_state.get("precompute_job") != precompute_key:
+            if st.session_state.get("precompute_job"):
+                jobs.cancel(st.session_state.precompute_job, session_id)
+            try:
+                jobs.submit(
+                    precompute_key,
+                    run_precompute_job,
+                    [lease.refs[i] for i in sel],
+                    [f"{frames_key}:{i}" for i in sel],
+                    settings,
+                    precompute_key,
+                    waiter=session_id,
+                )
+                jobs.on_result(precompute_key, adopt_precomputed)
+                st.session_state.precompute_job = precompute_key
+            except QueueFull:
+                # the pool is busy with real work; try again on the next rerun
+                pass
+        pre = jobs.status(precompute_key)
+        if pre["state"] == "done":
+            st.caption("Export frames are ready.")
+        elif pre["state"] in ("queued", "running"):
+            st.caption(f"Preparing export frames in the background ({pre['progress']:.0%})...")
+
+    col_exp1, col_exp2, col_exp3, col_exp4 = st.columns(4)
+    export_sheet = col_exp1.button("Download Sprite Sheet", type="primary")
+    export_zip = col_exp2.button("Download ZIP")
+    export_bundle = col_exp3.button("Download Bundle", help="All frames trimmed and packed in one .sprb file for the game's bundle loader")
+    export_pyramid = col_exp4.button("Download Pyramid", disabled=not pyramid_sizes, help="ZIP with one folder of frames per pyramid size plus pyramid.json")
+
+    if precompute_key and (export_sheet or export_zip or export_bundle or export_pyramid):
+        extract_params = st.session_state.extract_params
+        lease = st.session_state.get("frame_lease")
+        if export_sheet:
+            fmt = "sheet"
+        elif export_zip:
+            fmt = "zip"
+        elif export_bundle:
+            fmt = "bundle"
+        else:
+            fmt = "pyramid"
+        sizes = sorted(pyramid_sizes, reverse=True) if fmt == "pyramid" else None
+        params = {"extract": extract_params, "selected": sel, "settings": settings, "fmt": fmt, "frame_format": frame_format, "sizes": sizes}
+        export_key = job_key("export", Path(st.session_state.video_path).stem, params)
+        # the whole job: decode (or map the shared frames), process and encode in a worker
+        full_export = partial(
+            jobs.submit,
+            export_key,
+            run_export_job,
+            st.session_state.video_path,
+            extract_params["start"],
+            extract_params["end"],
+            extract_params["step"],
+            sel,
+            settings,
+            fmt,
+            target_fps=extract_params.get("target_fps"),
+            blend=extract_params.get("blend", False),
+            frame_format=frame_format,
+            sizes=sizes,
+            shared=(lease.refs, st.session_state.video_fps) if lease else None,
+            waiter=session_id,
+        )
+        fps = st.session_state.video_fps
+        out_fps = fps if extract_params.get("target_fps") else fps / max(1, extract_params["step"])
+        # pyramids are processed at their largest size, so only that canvas can be reused
+        reusable = fmt != "pyramid" or sizes[0] == canvas_w
+        st.session_state.pop("export_job", None)
+        pre_state = jobs.status(precompute_key)["state"]
+        if reusable and pre_state in ("running", "done"):
+            st.session_state.export_wait = {
+                "precompute": precompute_key,
+                "key": export_key,
+                "fmt": fmt,
+                "encode": (fmt, canvas_w, out_fps, frame_format, sizes),
+                "full": full_export,
+            }
+        else:
+            if pre_state == "queued":
+                # still waiting for a worker: the full export does the same work in one job
+                jobs.cancel(precompute_key, session_id)
+            try:
+                st.session_state.export_job = (full_export(), fmt)
+            except QueueFull:
+                st.warning("All workers are busy. Try again in a moment.")
+
+    export_wait = st.session_state.get("export_wait")
+    if export_wait:
+        pre = jobs.status(export_wait["precompute"])
+        if pre["state"] in ("queued", "running"):
+            job_progress(export_wait["precompute"], "Processing frames")
+        else:
+            del st.session_state["export_wait"]
+            result = jobs.result(export_wait["precompute"]) if pre["state"] == "done" else None
+            canvas_lease = None
+            if result is not None:
+                try:
+                    # held until the next export so the encode job can map the canvases
+                    canvas_lease = frame_cache.lease(result[0])
+                except (FileNotFoundError, TimeoutError):
+                    canvas_lease = None
+            try:
+                if canvas_lease is not None:
+                    st.session_state.export_lease = canvas_lease
+                    job_id = jobs.submit(
+                        export_wait["key"], run_encode_job, canvas_lease.refs, *export_wait["encode"], waiter=session_id
+                    )
                 else:
-                    # bbox from first non-empty frame (or union?)
-                    # Better to use union of all frames for animation relative
-                    union_bbox = None
-                    for p in processed_tmp:
-                        b = bbox_from_alpha(p)
-                        if b is not None:
-                            if union_bbox is None:
-                                union_bbox = b
-                            else:
-                                union_bbox = (
-                                    min(union_bbox[0], b[0]),
-                                    min(union_bbox[1], b[1]),
-                                    max(union_bbox[2], b[2]),
-                                    max(union_bbox[3], b[3])
-                                )
-                    
-                    if union_bbox is None:
-                        union_bbox = (0, 0, processed_tmp[0].width, processed_tmp[0].height)
-                    x1, y1, x2, y2 = union_bbox
-                
-                # apply reduce/trim
-                x1 = max(0, x1 - reduce_px)
-                y1 = max(0, y1 - reduce_px)
-                x2 = min(processed_tmp[0].width, x2 + reduce_px)
-                y2 = min(processed_tmp[0].height, y2 + reduce_px)
-                
-                for p in processed_tmp:
-                    crop = p.crop((x1, y1, x2, y2))
-                    # Resize to fit canvas_w
-                    # Maintain aspect ratio? Usually sprites are square or fit in square.
-                    # Let's fit into canvas_w x canvas_w
-                    
-                    # Scale factor
-                    scale = min(canvas_w / max(1, crop.width), canvas_w / max(1, crop.height))
-                    new_size = (int(crop.width * scale), int(crop.height * scale))
-                    crop_resized = crop.resize(new_size, Image.LANCZOS)
-                    
-                    canvas = Image.new("RGBA", (canvas_w, canvas_w), (0, 0, 0, 0))
-                    # Center it?
-                    off_x = (canvas_w - new_size[0]) // 2
-                    off_y = (canvas_w - new_size[1]) // 2
-                    canvas.paste(crop_resized, (off_x, off_y), crop_resized)
-                    processed.append(canvas)
+                    # cancelled, failed or evicted: do the whole export in a worker
+                    job_id = export_wait["full"]()
+                st.session_state.export_job = (job_id, export_wait["fmt"])
+            except QueueFull:
+                st.warning("All workers are busy. Try again in a moment.")
+
+    export_job = st.session_state.get("export_job")
+    if export_job:
+        export_id, fmt = export_job
+        status = show_job(export_id, "Processing frames")
+        if status["state"] == "done":
+            data = jobs.result(export_id)
+            if data is None:
+                st.info("Export result expired, export again.")
+            elif fmt == "sheet":
+                st.download_button("Download Sprite Sheet (Click again if needed)", data=data, file_name="spritesheet.png", mime="image/png")
+            elif fmt == "bundle":
+                st.download_button("Download Bundle (Click again if needed)", data=data, file_name="sprites.sprb", mime="application/octet-stream")
+            elif fmt == "pyramid":
+                st.download_button("Download Pyramid (Click again if needed)", data=data, file_name="sprites_pyramid.zip", mime="application/zip")
             else:
-                # Center-Center: compute bbox per frame and center into canvas
-                for p in processed_tmp:
-                    b = bbox_from_alpha(p)
-                    if b is None:
-                        # blank -> transparent canvas
-                        canvas = Image.new("RGBA", (canvas_w, canvas_w), (0, 0, 0, 0))
-                        processed.append(canvas)
-                        continue
-                    x1, y1, x2, y2 = b
-                    x1 = max(0, x1 - reduce_px)
-                    y1 = max(0, y1 - reduce_px)
-                    x2 = min(p.width, x2 + reduce_px)
-                    y2 = min(p.height, y2 + reduce_px)
-                    crop = p.crop((x1, y1, x2, y2))
-                    
-                    # resize preserving aspect to fit canvas
-                    crop.thumbnail((canvas_w, canvas_w), Image.LANCZOS)
-                    canvas = Image.new("RGBA", (canvas_w, canvas_w), (0, 0, 0, 0))
-                    cx = (canvas_w - crop.width) // 2
-                    cy = (canvas_w - crop.height) // 2
-                    canvas.paste(crop, (cx, cy), crop)
-                    processed.append(canvas)
-
-            if erode_px > 0:
-                processed = [halo_remove(p, erode_px) for p in processed]
-
-            if not processed:
-                st.error("No frames remain after processing")
-            else:
-                if export_sheet:
-                    cols = int(ceil(np.sqrt(len(processed))))
-                    sheet = make_spritesheet(processed, canvas_w, canvas_w, cols)
-                    buf = io.BytesIO()
-                    sheet.save(buf, format="PNG")
-                    st.download_button("Download Sprite Sheet (Click again if needed)", data=buf.getvalue(), file_name="spritesheet.png", mime="image/png")
-
-                if export_zip:
-                    buf = io.BytesIO()
-                    with zipfile.ZipFile(buf, "w") as z:
-                        for idx, img in enumerate(processed):
-                            b = pil_to_bytes(img)
-                            z.writestr(f"sprite_{idx:04d}.png", b)
-                    buf.seek(0)
-                    st.download_button("Download ZIP (Click again if needed)", data=buf.getvalue(), file_name="sprites.zip", mime="application/zip")
-
+                st.download_button("Download ZIP (Click again if needed)", data=data, file_name="sprites.zip", mime="application/zip")
 
 st.sidebar.header("About")
 st.sidebar.write("Video -> Sprite Pipeline")
@@ -0,0 +1,138 @@
+import hashlib
+import os
+import threading
+import uuid
+import weakref
+from collections import deque
+from pathlib import Path
+from typing import Collection, Dict, Set, Union
+
+CACHE_DIR = Path(".streamlit_video_cache")
+# Total size of cached uploads before the least recently used ones are deleted
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+def content_hash(data: Union[bytes, memoryview]) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def store_upload(
+    data: Union[bytes, memoryview],
+    suffix: str,
+    cache_dir: Path = CACHE_DIR,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+    in_use: Collection[Path] = (),
+) -> Path:
+    """Store an uploaded video once under its content hash and return the cached path.
+
+    Identical uploads from any session map to the same immutable file, so sessions never
+    overwrite each other. The file is written to a unique temp name and renamed into place.
+    Eviction never deletes the new file or any path in `in_use` (videos of live sessions).
+    """
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    path = cache_dir / f"{content_hash(data)}{suffix}"
+    if path.exists():
+        # mark as recently used for eviction
+        os.utime(path)
+        return path
+    tmp = cache_dir / f".{uuid.uuid4().hex}.part"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    evict_cache(cache_dir, max_bytes, keep={path, *in_use})
+    return path
+
+
+def evict_cache(cache_dir: Path = CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES, keep: Collection[Path] = ()):
+    """Delete least recently used cached uploads, except those in `keep`, until the cache fits in `max_bytes`."""
+    keep = {Path(p).resolve() for p in keep}
+    entries = []
+    for p in cache_dir.iterdir():
+        if p.name.startswith(".") or not p.is_file():
+            continue
+        st = p.stat()
+        entries.append((st.st_mtime, st.st_size, p))
+    total = sum(size for _, size, _ in entries)
+    for _, size, p in sorted(entries):
+        if total <= max_bytes:
+            break
+        if p.resolve() in keep:
+            continue
+        try:
+            p.unlink()
+        except OSError:
+            # another session may have removed it already
+            continue
+        total -= size
+
+
+class UploadHold:
+    """A session's use of a cached upload; released when it is garbage collected."""
+
+    def __init__(self, registry: "UploadRegistry", path: Path):
+        self.path = path
+        # GC can run inside the registry's own lock, so only queue the release here
+        weakref.finalize(self, registry._released.append, path)
+        self.touch()
+
+    def touch(self):
+        """Mark the file as recently used for eviction."""
+        try:
+            os.utime(self.path)
+        except OSError:
+            pass
+
+
+class UploadRegistry:
+    """Reference counts of the cached uploads that live sessions are using.
+
+    Pass `in_use()` to `store_upload` so that a new upload never evicts a video another
+    session still has open.
+    """
+
+    def __init__(self):
+        self._refs: Dict[Path, int] = {}
+        self._lock = threading.Lock()
+        self._released: deque = deque()
+
+    def hold(self, path: Union[str, Path]) -> UploadHold:
+        """Count a session's use of `path` until the returned hold is dropped."""
+        path = Path(path).resolve()
+        with self._lock:
+            self._drain_released()
+            self._refs[path] = self._refs.get(path, 0) + 1
+        return UploadHold(self, path)
+
+    def in_use(self) -> Set[Path]:
+        with self._lock:
+            self._drain_released()
+            return set(self._refs)
+
+    def _drain_released(self):
+        while self._released:
+            path = self._released.popleft()
+            count = self._refs.get(path, 0) - 1
+            if count > 0:
+                self._refs[path] = count
+            else:
+                self._refs.pop(path, None)
+
+
+def probe_video(path: Union[str, Path]) -> dict:
+    """Read duration, fps and frame count from the container without decoding frames."""
+    import imageio
+
+    reader = imageio.get_reader(str(path))
+    try:
+        meta = reader.get_meta_data()
+    finally:
+        reader.close()
+    nframes = meta.get("nframes")
+    if nframes is None or nframes == float("inf"):
+        nframes = 0
+    return {
+        "duration": float(meta.get("duration", 0.0)),
+        "fps": float(meta.get("fps", 30.0)),
+        "nframes": int(nframes),
+        "size": tuple(meta.get("size", (0, 0))),
+    }
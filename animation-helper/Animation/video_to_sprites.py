@@ -1,37 +1,41 @@
 import argparse
+import hashlib
+import json
 import os
 import io
 import sys
 from pathlib import Path
 
-import cv2
 import numpy as np
 from PIL import Image
 
-try:
-    from rembg import remove
-except Exception as e:
-    remove = None
-
-
-def parse_time(t):
-    """Parse a time string like 'MM:SS' or seconds as float/int."""
-    if t is None:
-        return None
-    if isinstance(t, (int, float)):
-        return float(t)
-    t = str(t)
-    if ":" in t:
-        parts = t.split(":")
-        parts = [float(p) for p in parts]
-        parts.reverse()
-        sec = 0.0
-        mul = 1.0
-        for p in parts:
-            sec += p * mul
-            mul *= 60.0
-        return sec
-    return float(t)
+# Pure helpers live in sprite_utils; re-exported here for existing imports
+from sprite_utils import parse_time, target_fps_plan
+from sprite_formats import FRAME_FORMATS, save_frame, write_bundle
+
+# cv2 and rembg (with onnxruntime) are slow to import, so they are loaded on first use
+_rembg_remove = None
+
+
+def _load_rembg():
+    global _rembg_remove
+    if _rembg_remove is None:
+        try:
+            from rembg import remove
+        except Exception:
+            remove = False
+        _rembg_remove = remove
+    return _rembg_remove or None
+
+
+def blend_frames(frames_weights):
+    """Weighted mix of equally sized uint8 frames, e.g. [(frame_a, 0.25), (frame_b, 0.75)]."""
+    if len(frames_weights) == 1:
+        return frames_weights[0][0]
+    acc = np.zeros(frames_weights[0][0].shape, dtype=np.float32)
+    for frame, w in frames_weights:
+        acc += frame.astype(np.float32) * w
+    return np.clip(acc + 0.5, 0, 255).astype(np.uint8)
 
 
 def ensure_dir(path):
@@ -40,6 +44,8 @@ def ensure_dir(path):
 
 def select_roi_interactive(frame):
     """Open a window for the user to select ROI. Returns (x,y,w,h)."""
+    import cv2
+
     cv2.namedWindow("Select ROI", cv2.WINDOW_NORMAL)
     r = cv2.selectROI("Select ROI", frame, fromCenter=False, showCrosshair=True)
     cv2.destroyWindow("Select ROI")
@@ -48,6 +54,7 @@ def select_roi_interactive(frame):
 
 def remove_bg_pil(img_pil):
     """Use rembg.remove on a PIL image, return RGBA PIL image."""
+    remove = _load_rembg()
     if remove is None:
         raise RuntimeError(
             "rembg is not available. Install dependencies with `pip install -r requirements.txt`."
@@ -61,18 +68,85 @@ def remove_bg_pil(img_pil):
     return out_img
 
 
+def file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def source_hash_for(path, st, job=None):
+    """Content hash of a source video with stat `st`, taken from `job` if it is unchanged."""
+    if (
+        job
+        and job.get("source") == str(path)
+        and job.get("source_size") == st.st_size
+        and job.get("source_mtime_ns") == st.st_mtime_ns
+        and job.get("source_hash")
+    ):
+        return job["source_hash"]
+    return file_sha256(path)
+
+
+def job_manifest_path(output_dir, prefix):
+    """Job manifest written alongside the sprites, e.g. `sprite_job.json`."""
+    return Path(output_dir) / f"{prefix}_job.json"
+
+
+def load_job_manifest(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_job_manifest(path, job):
+    # write-then-rename so an interrupted run never leaves a truncated manifest
+    tmp = Path(str(path) + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(job, f, indent=2)
+    os.replace(tmp, path)
+
+
 def frame_to_pil(frame_bgr):
+    import cv2
+
     frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
     return Image.fromarray(frame_rgb)
 
 
+def watch(args):
+    from clip_watcher import DEFAULT_ASSETS_DIR, DEFAULT_WATCH_DIRS, ClipWatcher
+
+    # the extraction options given on the command line become defaults for every clip
+    defaults = {
+        "start": parse_time(args.start) or 0.0,
+        "end": parse_time(args.end),
+        "step": max(1, args.step),
+        "target_fps": args.target_fps,
+        "blend": args.blend,
+        "prefix": args.prefix,
+        "format": args.format,
+        "bundle": args.bundle,
+    }
+    if args.roi:
+        defaults["roi"] = [int(p.strip()) for p in args.roi.split(",")]
+    watcher = ClipWatcher(
+        watch_dirs=args.watch_dir or DEFAULT_WATCH_DIRS,
+        assets_dir=args.assets_dir or DEFAULT_ASSETS_DIR,
+        jobs=max(1, args.jobs),
+        defaults=defaults,
+        overwrite=args.overwrite,
+    )
+    watcher.run(once=args.once)
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Extract frames from a video, remove backgrounds, and save sprites as PNGs with alpha."
     )
-    parser.add_argument("--input", "-i", required=True, help="Input video file path")
+    parser.add_argument("--input", "-i", help="Input video file path")
     parser.add_argument(
-        "--output", "-o", required=True, help="Output folder to store PNG sprites"
+        "--output", "-o", help="Output folder to store PNG sprites"
     )
     parser.add_argument(
         "--start",
@@ -100,25 +174,127 @@ def main():
         default=1,
         help="Save every Nth frame (default 1 = every frame).",
     )
+    parser.add_argument(
+        "--target-fps",
+        type=float,
+        default=None,
+        help="Resample to this frame rate (e.g. 12) instead of using --step. Unused frames are skipped without decoding.",
+    )
+    parser.add_argument(
+        "--blend",
+        action="store_true",
+        help="With --target-fps, blend the two nearest source frames instead of picking the nearest one.",
+    )
     parser.add_argument(
         "--prefix",
         default="sprite",
         help="Filename prefix for saved sprites (default 'sprite')",
     )
+    parser.add_argument(
+        "--format",
+        choices=FRAME_FORMATS,
+        default="png",
+        help="Frame file format: png or lossless webp (default png)",
+    )
+    parser.add_argument(
+        "--bundle",
+        action="store_true",
+        help="Also pack all sprites into <prefix>.sprb for the game's bundle loader",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted job in the output folder, skipping sprites already written.",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Run as a daemon: process new or changed <Character>_<Animation> clips from the watch folders "
+        "into Assets/Character/<Character>/<Animation> (chroma-key pipeline, settings from <clip>.json sidecars).",
+    )
+    parser.add_argument(
+        "--watch-dir",
+        action="append",
+        default=None,
+        help="Folder to watch (repeatable). Default: Videos/ next to this script and videos/ in the repo root.",
+    )
+    parser.add_argument("--assets-dir", default=None, help="Output root for --watch (default Assets/Character)")
+    parser.add_argument("--jobs", type=int, default=2, help="Clips processed in parallel with --watch (default 2)")
+    parser.add_argument("--once", action="store_true", help="With --watch, exit once every current clip is processed")
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="With --watch, also replace sprites in output folders that --watch did not write for the same clip",
+    )
     args = parser.parse_args()
 
+    if args.watch:
+        watch(args)
+        return
+    if not args.input or not args.output:
+        parser.error("--input and --output are required unless --watch is given")
+
+    import cv2
+
     input_path = args.input
     output_dir = args.output
     ensure_dir(output_dir)
 
     start_t = parse_time(args.start) or 0.0
     end_t = parse_time(args.end)
+    step = max(1, args.step)
+
+    roi = None
+    if args.roi:
+        try:
+            parts = [int(p.strip()) for p in args.roi.split(",")]
+            if len(parts) != 4:
+                raise ValueError()
+            roi = tuple(parts)
+        except Exception:
+            print("Invalid --roi value. Use 'x,y,w,h' with integers.")
+            sys.exit(1)
 
     cap = cv2.VideoCapture(input_path)
     if not cap.isOpened():
         print(f"Failed to open video: {input_path}")
         sys.exit(1)
 
+    manifest_path = job_manifest_path(output_dir, args.prefix)
+    # an earlier run's manifest spares hashing an unchanged video again
+    previous = load_job_manifest(manifest_path) if manifest_path.exists() else None
+    source_stat = os.stat(input_path)
+    source_hash = source_hash_for(input_path, source_stat, previous)
+    params = {
+        "start": start_t,
+        "end": end_t,
+        "step": step,
+        "target_fps": args.target_fps,
+        "blend": args.blend,
+        "prefix": args.prefix,
+        "format": args.format,
+    }
+    completed = set()
+    if args.resume and previous is not None:
+        job = previous
+        if job.get("source_hash") != source_hash:
+            print(f"Cannot resume: {manifest_path} was written for a different source video.")
+            sys.exit(1)
+        if job.get("params") != params or (roi is not None and tuple(job.get("roi") or ()) != roi):
+            print(f"Cannot resume: {manifest_path} was written with different parameters.")
+            sys.exit(1)
+        if job.get("roi") is not None:
+            roi = tuple(job["roi"])
+        # trust the manifest only for sprites that are still on disk
+        completed = {
+            i
+            for i in job.get("completed", [])
+            if os.path.exists(os.path.join(output_dir, f"{args.prefix}_{i:04d}.{args.format}"))
+        }
+        print(f"Resuming: {len(completed)} sprites already done.")
+    elif args.resume:
+        print(f"No job manifest at {manifest_path}, starting from the beginning.")
+
     fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
 
@@ -129,42 +305,58 @@ def main():
     if end_frame >= total_frames:
         end_frame = total_frames - 1
 
-    cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
-
-    # Read first available frame for ROI selection
-    ret, first_frame = cap.read()
-    if not ret:
-        print("Failed to read first frame from the requested start time.")
-        sys.exit(1)
-
-    roi = None
-    if args.interactive_roi:
+    if roi is None and args.interactive_roi:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        # Read first available frame for ROI selection
+        ret, first_frame = cap.read()
+        if not ret:
+            print("Failed to read first frame from the requested start time.")
+            sys.exit(1)
         roi = select_roi_interactive(first_frame)
         print(f"Selected ROI: {roi}")
-    elif args.roi:
-        try:
-            parts = [int(p.strip()) for p in args.roi.split(",")]
-            if len(parts) != 4:
-                raise ValueError()
-            roi = tuple(parts)
-        except Exception:
-            print("Invalid --roi value. Use 'x,y,w,h' with integers.")
-            sys.exit(1)
 
-    # Reset to start frame
-    cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    job = {
+        "source": str(input_path),
+        "source_hash": source_hash,
+        "source_size": source_stat.st_size,
+        "source_mtime_ns": source_stat.st_mtime_ns,
+        "params": params,
+        "roi": list(roi) if roi is not None else None,
+        "completed": sorted(completed),
+    }
+    write_job_manifest(manifest_path, job)
+
+    # One entry per output sprite: the source frames (and weights) it is made from
+    if args.target_fps:
+        plan = target_fps_plan(fps, start_frame, end_frame, args.target_fps, blend=args.blend)
+    else:
+        plan = [[(f, 1.0)] for f in range(start_frame, end_frame + 1, step)]
+    pending = [i for i in range(len(plan)) if i not in completed]
+    needed = {f for i in pending for f, _ in plan[i]}
 
-    out_idx = 0
-    frame_idx = start_frame
     saved = 0
     try:
-        while frame_idx <= end_frame:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            if (frame_idx - start_frame) % args.step != 0:
+        # Seek straight to the first sprite that still has to be written
+        frame_idx = plan[pending[0]][0][0] if pending else end_frame + 1
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+        decoded = {}
+        for out_idx in pending:
+            entry = plan[out_idx]
+            while frame_idx <= entry[-1][0]:
+                if frame_idx in needed:
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    decoded[frame_idx] = frame
+                elif not cap.grab():
+                    # advance without decoding the frame
+                    break
                 frame_idx += 1
-                continue
+            if any(f not in decoded for f, _ in entry):
+                break
+            frame = blend_frames([(decoded[f], w) for f, w in entry])
+            # keep only frames that later sprites can still use
+            decoded = {f: d for f, d in decoded.items() if f >= entry[-1][0]}
 
             proc_frame = frame
             if roi is not None:
@@ -184,21 +376,38 @@ def main():
                 print("Saving cropped RGB frame without alpha instead.")
                 out_pil = pil.convert("RGBA")
 
-            out_name = f"{args.prefix}_{out_idx:04d}.png"
+            out_name = f"{args.prefix}_{out_idx:04d}.{args.format}"
             out_path = os.path.join(output_dir, out_name)
-            out_pil.save(out_path)
+            save_frame(out_pil, out_path, args.format)
+
+            completed.add(out_idx)
+            job["completed"] = sorted(completed)
+            write_job_manifest(manifest_path, job)
 
             if out_idx % 10 == 0:
-                print(f"Saved: {out_path} (frame {frame_idx}/{end_frame})")
+                print(f"Saved: {out_path} (frame {entry[0][0]}/{end_frame})")
 
-            out_idx += 1
             saved += 1
-            frame_idx += 1
     finally:
         cap.release()
 
     print(f"Done. Saved {saved} sprites to: {output_dir}")
 
+    if args.bundle:
+        done = sorted(completed)
+        frames = []
+        for i in done:
+            with Image.open(os.path.join(output_dir, f"{args.prefix}_{i:04d}.{args.format}")) as img:
+                frames.append(img.convert("RGBA"))
+        if frames:
+            bundle_fps = args.target_fps or fps / step
+            bundle_path = write_bundle(frames, os.path.join(output_dir, args.prefix), fps=bundle_fps)
+            print(f"Wrote bundle: {bundle_path} ({len(frames)} frames)")
+
+    from manifest_builder import update_manifest
+
+    update_manifest(output_dir)
+
 
 if __name__ == "__main__":
     main()
@@ -174,7 +174,7 @@ export class BattleScene extends Phaser.Scene {
             if (manifest && manifest.characters) {
                 const charEntry = manifest.characters.find((c: any) => c.name === charNameParam);
                 if (charEntry) {
-                    if (charEntry.idleFrames && charEntry.idleFrames.length > 0) {
+                    if ((charEntry.idleFrames && charEntry.idleFrames.length > 0) || (charEntry.bundles && charEntry.bundles.idle)) {
                         tex = `${charNameParam}_idle_0`;
                     } else if (charEntry.idleFrame) {
                         tex = `${charNameParam}_idle`;
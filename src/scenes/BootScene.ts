@@ -1,4 +1,5 @@
 import Phaser from 'phaser';
+import { loadSpriteBundle } from '../utils/SpriteBundleLoader';
 
 export class BootScene extends Phaser.Scene {
     constructor() {
@@ -15,6 +16,7 @@ export class BootScene extends Phaser.Scene {
 
     create() {
         const manifest = this.cache.json.get('character-manifest');
+        const bundleLoads: Promise<number>[] = [];
         if (manifest && manifest.characters) {
             // expose manifest to other scenes via registry so they can read per-character settings
             this.registry.set('character-manifest', manifest);
@@ -65,17 +67,28 @@ export class BootScene extends Phaser.Scene {
                             this.load.image(`${char.name}_block_${index}`, frame);
                         });
                     }
+
+                    // Load sprite bundles (.sprb), e.g. "bundles": { "idle": "Assets/.../idle.sprb" }
+                    if (char.bundles) {
+                        Object.entries(char.bundles).forEach(([anim, url]) => {
+                            bundleLoads.push(loadSpriteBundle(this, `${char.name}_${anim}`, url as string));
+                        });
+                    }
             });
 
             this.load.start();
         }
 
-        this.load.once('complete', () => {
-            this.scene.start('BattleScene');
-        });
+        const startBattle = () => {
+            Promise.all(bundleLoads)
+                .catch((e) => console.warn('Failed to load sprite bundle:', e))
+                .then(() => this.scene.start('BattleScene'));
+        };
+
+        this.load.once('complete', startBattle);
 
         if (this.load.totalToLoad === 0) {
-            this.scene.start('BattleScene');
+            startBattle();
         }
     }
 }
@@ -0,0 +1,116 @@
+// Loader for .sprb sprite bundles written by animation-helper/Animation/sprite_formats.py
+//
+// A bundle holds every frame of one animation: trimmed RGB (row-delta coded) plus
+// run-length encoded alpha, deflated as one stream. Frames are added as canvas textures
+// named `${key}_${index}`, the same keys BootScene uses for individually loaded PNGs.
+
+import Phaser from 'phaser';
+
+export interface SpriteBundleFrame {
+    x: number;
+    y: number;
+    w: number;
+    h: number;
+    rgb: [number, number];
+    alpha: [number, number];
+}
+
+export interface SpriteBundleHeader {
+    version: number;
+    frameWidth: number;
+    frameHeight: number;
+    fps: number | null;
+    frames: SpriteBundleFrame[];
+}
+
+export interface DecodedSpriteBundle {
+    header: SpriteBundleHeader;
+    frames: ImageData[];
+    decodeMs: number;
+}
+
+const MAGIC = 'SPRB';
+const SUPPORTED_VERSION = 1;
+
+async function inflate(data: Uint8Array): Promise<Uint8Array> {
+    // 'deflate' is the zlib-wrapped format written by Python's zlib.compress
+    const stream = new Blob([data]).stream().pipeThrough(new DecompressionStream('deflate'));
+    return new Uint8Array(await new Response(stream).arrayBuffer());
+}
+
+export async function decodeSpriteBundle(buffer: ArrayBuffer): Promise<DecodedSpriteBundle> {
+    const t0 = performance.now();
+    const bytes = new Uint8Array(buffer);
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(bytes[0], bytes[1], bytes[2], bytes[3]);
+    if (magic !== MAGIC) {
+        throw new Error('Not a sprite bundle');
+    }
+    const version = view.getUint8(4);
+    if (version !== SUPPORTED_VERSION) {
+        throw new Error(`Unsupported sprite bundle version ${version}`);
+    }
+    const headerLength = view.getUint32(8, true);
+    const header: SpriteBundleHeader = JSON.parse(new TextDecoder().decode(bytes.subarray(12, 12 + headerLength)));
+    const payload = await inflate(bytes.subarray(12 + headerLength));
+
+    const width = header.frameWidth;
+    const height = header.frameHeight;
+    const frames = header.frames.map((f) => {
+        const image = new ImageData(width, height);
+        const out = image.data;
+        if (f.w === 0 || f.h === 0) {
+            return image;
+        }
+        const rgb = payload.subarray(f.rgb[0], f.rgb[0] + f.rgb[1]);
+        const rowBytes = f.w * 3;
+        // undo the row prediction: each row is stored minus the row above
+        const pixels = Uint8Array.from(rgb);
+        for (let i = rowBytes; i < pixels.length; i++) {
+            pixels[i] = (pixels[i] + pixels[i - rowBytes]) & 0xff;
+        }
+        for (let row = 0; row < f.h; row++) {
+            let src = row * rowBytes;
+            let dst = ((f.y + row) * width + f.x) * 4;
+            for (let col = 0; col < f.w; col++) {
+                out[dst] = pixels[src];
+                out[dst + 1] = pixels[src + 1];
+                out[dst + 2] = pixels[src + 2];
+                src += 3;
+                dst += 4;
+            }
+        }
+        // alpha runs: (length, value) byte pairs over the trimmed box in row order
+        const alpha = payload.subarray(f.alpha[0], f.alpha[0] + f.alpha[1]);
+        let p = 0;
+        for (let i = 0; i < alpha.length; i += 2) {
+            const run = alpha[i];
+            const value = alpha[i + 1];
+            for (let k = 0; k < run; k++, p++) {
+                const row = Math.floor(p / f.w);
+                const col = p - row * f.w;
+                out[((f.y + row) * width + f.x + col) * 4 + 3] = value;
+            }
+        }
+        return image;
+    });
+    return { header, frames, decodeMs: performance.now() - t0 };
+}
+
+// Fetch a bundle and register its frames as `${key}_0`, `${key}_1`, ... Returns the frame count.
+export async function loadSpriteBundle(scene: Phaser.Scene, key: string, url: string): Promise<number> {
+    const response = await fetch(url);
+    if (!response.ok) {
+        throw new Error(`Failed to load sprite bundle ${url}: ${response.status}`);
+    }
+    const { header, frames, decodeMs } = await decodeSpriteBundle(await response.arrayBuffer());
+    frames.forEach((image, index) => {
+        const canvas = document.createElement('canvas');
+        canvas.width = header.frameWidth;
+        canvas.height = header.frameHeight;
+        canvas.getContext('2d')!.putImageData(image, 0, 0);
+        scene.textures.addCanvas(`${key}_${index}`, canvas);
+    });
+    console.log(`Loaded sprite bundle ${url}: ${frames.length} frames, decoded in ${decodeMs.toFixed(1)} ms`);
+    return frames.length;
+}